@@ -1,27 +1,51 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import numpy as np
 import pandas as pd
-import researchpy as rp
-
-#
-pd.set_option('display.max_columns', None)
-#
-pd.set_option('display.max_rows', None)
-#
-pd.set_option('display.float_format', lambda x: '%.2f' % x)
-#
-pd.options.mode.chained_assignment = None
-
-pd.set_option('display.max_columns', None)
-pd.set_option('display.max_rows', None)
-pd.set_option('display.float_format',lambda x:'%.2f' % x)
-pd.set_option('display.width',1000)
-pd.set_option('display.expand_frame_repr', False)
-pd.set_option('display.max_seq_items', None)
-pd.set_option('max_colwidth', None)
-pd.set_option('display.colheader_justify', 'right')
-pd.set_option('display.html.table_schema', True)
-pd.set_option('display.unicode.east_asian_width', True)
+
+# Display settings, they are applied only with set_display_options or inside display_options
+DISPLAY_OPTIONS = {'display.max_columns': None,
+                   'display.max_rows': None,
+                   'display.float_format': lambda x: '%.2f' % x,
+                   'display.width': 1000,
+                   'display.expand_frame_repr': False,
+                   'display.max_seq_items': None,
+                   'display.max_colwidth': None,
+                   'display.colheader_justify': 'right',
+                   'display.html.table_schema': True,
+                   'display.unicode.east_asian_width': True,
+                   'mode.chained_assignment': None}
+
+def set_display_options(**options):
+
+    """
+    Applies DISPLAY_OPTIONS globally, options overrides or extends them.
+
+    Test and Example:
+
+    set_display_options()
+
+    set_display_options(**{'display.max_rows': 100})
+    """
+
+    for key, value in {**DISPLAY_OPTIONS, **options}.items():
+        pd.set_option(key, value)
+
+@contextmanager
+def display_options(**options):
+
+    """
+    Applies DISPLAY_OPTIONS only inside a with block, options overrides or extends them.
+
+    Test and Example:
+
+    with display_options(**{'display.max_rows': 100}):
+        data_info(data)
+    """
+
+    with pd.option_context(*[i for item in {**DISPLAY_OPTIONS, **options}.items() for i in item]):
+        yield
 
 # EXCEL FILES
 def read_all_excel_files(filename:str) -> list:
@@ -33,18 +57,15 @@ def read_all_excel_files(filename:str) -> list:
     file_list = []
 
     for i in files:
-        if "xlsx" and "xls" in i:
+        if i.lower().endswith((".xlsx", ".xls")):
             file_list.append(i)
 
     return file_list
 
-def read_all_excel_sheets(filename: str) -> print:
+def read_all_excel_sheets(filename: str, nrows: int = 5) -> print:
 
-    for i in pd.ExcelFile(filename).sheet_names:
-        print("Sheet Name: " + i)
-        print("#" * 100)
-        print(pd.read_excel(filename, sheet_name = i).head())
-        print("#" * 100)
+    # The workbook is opened once and only the first rows of each sheet are parsed
+    Workbook(filename).preview(nrows)
 
     # for i in file_list:
     # print("\n" * 2)
@@ -54,6 +75,155 @@ def read_all_excel_sheets(filename: str) -> print:
     # read_all_sheets(i)
 
 
+# Parsed sheets of Workbook, keyed by (file path, modification time, sheet name), least recently used first
+_SHEET_CACHE = OrderedDict()
+_SHEET_CACHE_SIZE = 16
+
+class Workbook:
+
+    """
+    Lazy access to the sheets of an Excel file.
+    The file is opened once, sheet names are listed without parsing the sheets,
+    and a sheet is parsed only when it is asked for. Parsed sheets are kept in an LRU cache
+    keyed by the file path and its modification time, so the same sheet is not parsed twice.
+    With parquet=True, parsed sheets are also saved as Parquet files next to the workbook
+    and they are read from there while the workbook is not modified.
+
+    :param filename: path of the Excel file as string
+    :param parquet: if True, parsed sheets are saved to and read from Parquet files. It uses the pyarrow library.
+    :param parquet_dir: directory of the Parquet files, None uses the directory of the workbook
+
+    Test and Example:
+
+    book = Workbook("results.xlsx", parquet=True)
+
+    book.sheet_names
+
+    book.head("Sheet1", nrows=10)
+
+    data = book["Sheet1"]
+    """
+
+    def __init__(self, filename: str, parquet: bool = False, parquet_dir: str = None):
+
+        from os.path import abspath
+
+        self.filename = abspath(filename)
+        self.parquet = parquet
+        self.parquet_dir = parquet_dir
+        self._file = None
+        self._file_mtime = None
+
+    @property
+    def mtime(self) -> float:
+
+        from os.path import getmtime
+
+        return getmtime(self.filename)
+
+    @property
+    def file(self) -> pd.ExcelFile:
+
+        mtime = self.mtime
+
+        # The file is opened again only if it was modified
+        if self._file is None or self._file_mtime != mtime:
+            self.close()
+            self._file = pd.ExcelFile(self.filename)
+            self._file_mtime = mtime
+
+        return self._file
+
+    @property
+    def sheet_names(self) -> list:
+
+        return self.file.sheet_names
+
+    def head(self, sheet_name: str, nrows: int = 5) -> pd.DataFrame:
+
+        """
+        Parses only the first nrows rows of a sheet.
+        """
+
+        return self.file.parse(sheet_name, nrows=nrows)
+
+    def parquet_path(self, sheet_name: str) -> str:
+
+        from os.path import basename, dirname, join
+
+        return join(self.parquet_dir or dirname(self.filename), f"{basename(self.filename)}.{sheet_name}.parquet")
+
+    def sheet(self, sheet_name: str) -> pd.DataFrame:
+
+        """
+        Returns a whole sheet, from the cache if it was parsed before.
+        The returned dataframe is a copy, changing it does not change the cache.
+        """
+
+        from os.path import exists, getmtime
+
+        mtime = self.mtime
+
+        if self.parquet:
+            path = self.parquet_path(sheet_name)
+            if exists(path) and getmtime(path) >= mtime:
+                return pd.read_parquet(path)
+
+        key = (self.filename, mtime, sheet_name)
+        if key in _SHEET_CACHE:
+            _SHEET_CACHE.move_to_end(key)
+            data = _SHEET_CACHE[key]
+        else:
+            data = self.file.parse(sheet_name)
+            _SHEET_CACHE[key] = data
+            if len(_SHEET_CACHE) > _SHEET_CACHE_SIZE:
+                _SHEET_CACHE.popitem(last=False)
+
+        if self.parquet:
+            try:
+                data.to_parquet(path)
+            except (ImportError, ValueError, TypeError):
+                # Sheets with mixed type columns can not be saved, they are only kept in the LRU cache
+                pass
+
+        return data.copy()
+
+    def __getitem__(self, sheet_name: str) -> pd.DataFrame:
+
+        return self.sheet(sheet_name)
+
+    def to_parquet(self) -> list:
+
+        """
+        Saves every sheet as a Parquet file for fast reloads.
+
+        :return: paths of the Parquet files
+        """
+
+        parquet = self.parquet
+        self.parquet = True
+        try:
+            for i in self.sheet_names:
+                self.sheet(i)
+        finally:
+            self.parquet = parquet
+
+        return [self.parquet_path(i) for i in self.sheet_names]
+
+    def preview(self, nrows: int = 5) -> print:
+
+        for i in self.sheet_names:
+            print("Sheet Name: " + i)
+            print("#" * 100)
+            print(self.head(i, nrows))
+            print("#" * 100)
+
+    def close(self):
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 # https: // stackoverflow.com / questions / 17977540 / pandas - looking - up - the - list - of - sheets - in -an - excel - file
 
 # xl = pd.ExcelFile('foo.xls')
@@ -72,15 +242,368 @@ def read_all_csv_files(filename:str) -> list:
     file_list = []
 
     for i in files:
-        if "csv" in i:
+        if i.lower().endswith(".csv"):
             file_list.append(i)
 
     return file_list
 
+# READ MANY FILES
+def _read_file(path: str, file_type: str, dtype=None, usecols=None, kwargs: dict = None) -> tuple:
+
+    """
+    Reads one CSV or Excel file for read_files, errors are returned instead of raised.
+
+    :return: dataframe or None, seconds, error message or None
+    """
+
+    from time import perf_counter
+
+    start = perf_counter()
+
+    try:
+        if file_type == "csv":
+            data = pd.read_csv(path, dtype=dtype, usecols=usecols, **(kwargs or {}))
+        else:
+            data = pd.read_excel(path, dtype=dtype, usecols=usecols, **(kwargs or {}))
+    except Exception as error:
+        return None, perf_counter() - start, f"{type(error).__name__}: {error}"
+
+    return data, perf_counter() - start, None
+
+def read_files(filename: str, file_type: str = "csv", n_jobs: int = None, processes: bool = False, dtype=None, usecols=None,
+               source_column: str = "source_file", **kwargs) -> tuple:
+
+    """
+    Finds the CSV or Excel files in a directory with read_all_csv_files / read_all_excel_files,
+    reads them concurrently and concatenates them with a column holding the file name of each row.
+    A file that can not be read does not stop the others, it is reported with its error.
+
+    :param filename: directory path as string
+    :param file_type: "csv" or "excel"
+    :param n_jobs: number of workers, None uses the default of concurrent.futures
+    :param processes: if True, a process pool is used instead of threads. Useful for many small files.
+    :param dtype: dtype hint for the columns, same as pd.read_csv
+    :param usecols: columns to read, same as pd.read_csv
+    :param source_column: name of the column holding the file name, None does not add it
+    :param kwargs: other parameters of pd.read_csv or pd.read_excel, such as encoding or sep
+    :return: data as dataframe and report as dataframe with file, rows, seconds and error columns
+
+    Test and Example:
+
+    data, report = read_files("data/", dtype={"ID": "int32"}, usecols=["ID", "TEST", "RESULT"], encoding="latin-1")
+
+    report[report["error"].notnull()]
+    """
+
+    from os.path import join
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if file_type == "csv":
+        files = read_all_csv_files(filename)
+    elif file_type == "excel":
+        files = read_all_excel_files(filename)
+    else:
+        raise ValueError("file_type parameter must be 'csv' or 'excel'")
+
+    files = sorted(files)
+    paths = [join(filename, i) for i in files]
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=n_jobs) as pool:
+        results = list(pool.map(_read_file, paths, [file_type] * len(paths), [dtype] * len(paths),
+                                [usecols] * len(paths), [kwargs] * len(paths)))
+
+    frames = []
+    report = []
+    for file, (data, seconds, error) in zip(files, results):
+        report.append({"file": file, "rows": None if data is None else len(data), "seconds": seconds, "error": error})
+        if data is not None:
+            if source_column:
+                data[source_column] = file
+            frames.append(data)
+
+    data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    if source_column and source_column in data.columns:
+        data[source_column] = data[source_column].astype("category")
+
+    return data, pd.DataFrame(report, columns=["file", "rows", "seconds", "error"])
+
+# SNAPSHOTS
+def save_snapshot(data: pd.DataFrame, path: str, compression: str = "uncompressed", chunksize: int = None) -> str:
+
+    """
+    Saves a dataframe as an Arrow IPC (Feather version 2) file, to be opened with Snapshot or load_snapshot.
+    The file is written to a temporary file and renamed, so a reader never sees a half written snapshot.
+    It uses the pyarrow library.
+
+    :param data: dataframe as pandas dataframe
+    :param path: path of the file, e.g. "clean.arrow" or "clean.feather"
+    :param compression: "uncompressed", "lz4" or "zstd". Only uncompressed files are read without a copy,
+                        compressed files are smaller but they are decompressed into memory when read.
+    :param chunksize: number of rows of a record batch, None writes one batch. A column of one batch is read as one
+                      array without a copy, a column of many batches is concatenated when converted to pandas.
+    :return: path
+
+    Test and Example:
+
+    save_snapshot(data, "clean.arrow")
+
+    data = load_snapshot("clean.arrow", columns=["ID", "RESULT"])
+    """
+
+    import os
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    # pip install pyarrow
+
+    table = pa.Table.from_pandas(data)
+    feather.write_feather(table, path + ".tmp", compression=compression, chunksize=chunksize or max(len(data), 1))
+    os.replace(path + ".tmp", path)
+
+    return path
+
+class Snapshot:
+
+    """
+    Lazy, memory mapped access to an Arrow IPC (Feather) file saved with save_snapshot.
+    The file is mapped into memory instead of being read, and a column is converted to pandas only when it is
+    asked for, so opening a snapshot and selecting a few columns takes about the same time whatever its size.
+    Numeric columns without missing values and, with strings="arrow", text columns are views of the mapped file
+    without a copy. Their values are read only, copy the dataframe before changing values in place.
+
+    Worker processes can open the same file, the operating system keeps one copy of the pages for all of them.
+    A Snapshot is pickled as its path, so it can be sent to a process pool instead of the dataframe.
+
+    :param path: path of the file
+    :param strings: "arrow" keeps the text columns as string[pyarrow] on the mapped memory,
+                    None converts them to Python strings (object), which copies them
+    :param memory_map: if False, the file is read into memory instead of being mapped
+
+    Test and Example:
+
+    snapshot = Snapshot("clean.arrow")
+
+    snapshot.columns, snapshot.shape
+
+    data = snapshot[["ID", "RESULT"]]
+
+    results = executor.map(worker, [snapshot] * 8)
+    """
+
+    def __init__(self, path: str, strings: str = "arrow", memory_map: bool = True):
+
+        from os.path import abspath
+
+        if strings not in ("arrow", None):
+            raise ValueError("strings parameter must be 'arrow' or None")
+
+        self.path = abspath(path)
+        self.strings = strings
+        self.memory_map = memory_map
+        self._table = None
+
+    @property
+    def table(self):
+
+        """
+        The file as a pyarrow Table, its buffers are on the mapped file.
+        """
+
+        if self._table is None:
+            import pyarrow as pa
+            # pip install pyarrow
+
+            source = pa.memory_map(self.path) if self.memory_map else pa.OSFile(self.path)
+            self._table = pa.ipc.open_file(source).read_all()
+
+        return self._table
+
+    @property
+    def columns(self) -> list:
+
+        # The index columns saved by pandas are not data columns
+        index = [i for i in self.pandas_metadata.get("index_columns", []) if isinstance(i, str)]
+
+        return [i for i in self.table.column_names if i not in index]
+
+    @property
+    def pandas_metadata(self) -> dict:
+
+        return self.table.schema.pandas_metadata or {}
+
+    @property
+    def shape(self) -> tuple:
+
+        return self.table.num_rows, len(self.columns)
+
+    def __len__(self) -> int:
+
+        return self.table.num_rows
+
+    def to_pandas(self, columns: list = None) -> pd.DataFrame:
+
+        """
+        :param columns: columns to convert, None converts all columns
+        :return: dataframe
+        """
+
+        import pyarrow as pa
+
+        table = self.table
+        if columns is not None:
+            # The saved index is kept with the selected columns
+            index = [i for i in self.pandas_metadata.get("index_columns", []) if isinstance(i, str)]
+            table = table.select(list(columns) + [i for i in index if i not in columns])
+
+        types_mapper = {pa.string(): pd.StringDtype("pyarrow")}.get if self.strings == "arrow" else None
+
+        # split_blocks keeps every column as its own array, so the columns are not copied into one block
+        return table.to_pandas(split_blocks=True, types_mapper=types_mapper)
+
+    def __getitem__(self, columns) -> pd.DataFrame or pd.Series:
+
+        if isinstance(columns, list):
+            return self.to_pandas(columns)
+
+        return self.to_pandas([columns])[columns]
+
+    def __getstate__(self) -> dict:
+
+        # Only the path is pickled, the file is mapped again in the other process
+        return {"path": self.path, "strings": self.strings, "memory_map": self.memory_map}
+
+    def __setstate__(self, state: dict):
+
+        self.__init__(**state)
+
+    def close(self):
+
+        """
+        Releases the table, the file is unmapped when no dataframe uses its memory.
+        """
+
+        self._table = None
+
+def load_snapshot(path: str, columns: list = None, strings: str = "arrow") -> pd.DataFrame:
+
+    """
+    Loads the columns of a snapshot saved with save_snapshot, see Snapshot.
+
+    :param path: path of the file
+    :param columns: columns to load, None loads all columns
+    :param strings: same as Snapshot
+    :return: dataframe
+    """
+
+    return Snapshot(path, strings=strings).to_pandas(columns)
+
+# MEMORY
+def _compact_series(series: pd.Series, category_threshold: float = 0.5, strings: str = "arrow", float32: bool = False) -> pd.Series:
+
+    """
+    Returns series with the smallest dtype that keeps its values, see optimize_dtypes.
+    """
+
+    kind = series.dtype.kind
+
+    if kind in "iu":
+        return pd.to_numeric(series, downcast="unsigned" if kind == "u" else "integer")
+
+    if kind == "f":
+        return series.astype(np.float32) if float32 and series.dtype.itemsize > 4 else series
+
+    if series.dtype != object:
+        return series
+
+    values = series.dropna()
+    if values.empty:
+        return series
+
+    if values.nunique() <= category_threshold * len(values):
+        return series.astype("category")
+
+    if strings == "arrow" and pd.api.types.infer_dtype(values, skipna=True) == "string":
+        import pyarrow
+        # pip install pyarrow
+
+        return series.astype("string[pyarrow]")
+
+    return series
+
+def _dtype_name(dtype) -> str:
+
+    # str of string[pyarrow] is only "string"
+    return f"string[{dtype.storage}]" if isinstance(dtype, pd.StringDtype) else str(dtype)
+
+def optimize_dtypes(data: pd.DataFrame, columns: list = None, category_threshold: float = 0.5, strings: str = "arrow",
+                    float32: bool = False) -> tuple:
+
+    """
+    Converts the columns of a dataframe to smaller dtypes and reports the memory saved.
+    Integers are downcast to the smallest integer type of their range and object columns with few distinct values
+    become category. The other text columns become Arrow backed strings, which keep the characters in one buffer
+    instead of a Python object per row. Floats are kept, float32 loses precision and must be asked for.
+    Object columns of mixed types can only become category, columns of other dtypes are not changed.
+
+    :param data: dataframe as pandas dataframe
+    :param columns: columns to convert, None converts all of them
+    :param category_threshold: an object column becomes category when its number of distinct values
+                               is at most this ratio of its non missing values
+    :param strings: "arrow" converts text columns to string[pyarrow], None keeps them as object. It uses pyarrow.
+    :param float32: if True, float64 columns are converted to float32
+    :return: data as a new dataframe and report as dataframe with column, before, after, before_bytes,
+             after_bytes and saved_bytes columns
+
+    Test and Example:
+
+    data, report = read_files("data/")
+
+    data, report = optimize_dtypes(data)
+
+    report["saved_bytes"].sum() / 2 ** 20
+    """
+
+    if strings not in ("arrow", None):
+        raise ValueError("strings parameter must be 'arrow' or None")
+
+    # A shallow copy, the converted columns replace the columns of the copy and data is not changed
+    result = data.copy(deep=False)
+
+    report = []
+    for i, column in enumerate(data.columns):
+        if columns is not None and column not in columns:
+            continue
+
+        series = data.iloc[:, i]
+        compact = _compact_series(series, category_threshold=category_threshold, strings=strings, float32=float32)
+        if compact is not series:
+            result.isetitem(i, compact)
+
+        before = series.memory_usage(deep=True, index=False)
+        after = compact.memory_usage(deep=True, index=False)
+        report.append({"column": column, "before": _dtype_name(series.dtype), "after": _dtype_name(compact.dtype),
+                       "before_bytes": before, "after_bytes": after, "saved_bytes": before - after})
+
+    report = pd.DataFrame(report, columns=["column", "before", "after", "before_bytes", "after_bytes", "saved_bytes"])
+
+    return result, report
+
 # Data info
 
 def data_info(data, head = 5, tail = 5):
 
+    # A ProfileState or DataProfile is printed with the same sections, without the data
+    if isinstance(data, ProfileState):
+        data = data.to_profile()
+    if isinstance(data, DataProfile):
+        print("\n", data)
+        return
+
+    import researchpy as rp
+    # pip install researchpy
+
     print("\n", "#" * 25, "Head" , "#" *25)
     print(data.head(head), "\n")
 
@@ -108,6 +631,623 @@ def data_info(data, head = 5, tail = 5):
     print("#" * 25, "Quantiles", "#" *25)
     print(data.quantile([0, 0.05, 0.25, 0.95, 0.99, 1]).T, "\n")
 
+# Data profile
+
+class DataProfile:
+
+    """
+    Result of profile, the same sections as data_info as a structured object.
+
+    rows, columns and dtypes describe the whole data. missing, continuous, categorical and quantiles are computed
+    over all rows, or over the sample rows if sampled is True. The quantiles are approximate,
+    they are computed from a uniform sample of sample_size rows. invalid is the number of values of each numeric column
+    that are not numbers (e.g. text in a later chunk of pd.read_csv), they are not in the statistics of the column.
+
+    It can be printed, or exported with to_dict, to_json and to_html.
+    """
+
+    def __init__(self, rows: int, dtypes: pd.Series, head: pd.DataFrame, tail: pd.DataFrame, missing: pd.Series,
+                 continuous: pd.DataFrame, categorical: pd.DataFrame, quantiles: pd.DataFrame, sampled: bool, sample_size: int,
+                 invalid: pd.Series = None):
+
+        self.rows = rows
+        self.dtypes = dtypes
+        self.head = head
+        self.tail = tail
+        self.missing = missing
+        self.continuous = continuous
+        self.categorical = categorical
+        self.quantiles = quantiles
+        self.sampled = sampled
+        self.sample_size = sample_size
+        self.invalid = pd.Series(dtype=np.int64) if invalid is None else invalid
+
+    @property
+    def columns(self) -> list:
+
+        return list(self.dtypes.index)
+
+    @property
+    def shape(self) -> tuple:
+
+        return self.rows, len(self.dtypes)
+
+    def sections(self) -> dict:
+
+        """
+        Returns the sections in the order data_info prints them.
+        """
+
+        sections = {"Head": self.head,
+                    "Tail": self.tail,
+                    "Missing Values": pd.DataFrame(self.missing)}
+
+        # Only shown when a numeric column has values that are not numbers
+        if self.invalid.sum():
+            sections["Invalid Numbers"] = pd.DataFrame(self.invalid[self.invalid > 0])
+
+        return {**sections,
+                "Data Types": pd.DataFrame(self.dtypes),
+                "Shape": self.shape,
+                "Columns": self.columns,
+                "Categorical Variables Summary": self.categorical,
+                "Continuous Variables Summary": self.continuous,
+                "Quantiles": self.quantiles}
+
+    def __str__(self) -> str:
+
+        text = []
+        for name, section in self.sections().items():
+            text.append(" ".join(["#" * 25, name, "#" * 25]))
+            text.append(str(section) + "\n")
+
+        return "\n".join(text)
+
+    def to_dict(self) -> dict:
+
+        return {"rows": self.rows,
+                "columns": self.columns,
+                "dtypes": self.dtypes.astype(str).to_dict(),
+                "sampled": self.sampled,
+                "sample_size": self.sample_size,
+                "head": self.head.to_dict(orient="records"),
+                "tail": self.tail.to_dict(orient="records"),
+                "missing": self.missing.to_dict(),
+                "invalid": self.invalid.to_dict(),
+                "continuous": self.continuous.to_dict(orient="index"),
+                "categorical": self.categorical.to_dict(orient="records"),
+                "quantiles": {str(k): v for k, v in self.quantiles.to_dict(orient="index").items()}}
+
+    def to_json(self, path: str = None, **kwargs) -> str:
+
+        """
+        :param path: if given, the JSON is also written to this file
+        :param kwargs: other parameters of json.dumps such as indent
+        :return: JSON as string
+        """
+
+        import json
+
+        text = json.dumps(self.to_dict(), default=str, **kwargs)
+
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(text)
+
+        return text
+
+    def to_html(self) -> str:
+
+        html = []
+        for name, section in self.sections().items():
+            html.append(f"<h3>{name}</h3>")
+            html.append(section.to_html() if isinstance(section, pd.DataFrame) else f"<p>{section}</p>")
+
+        return "\n".join(html)
+
+def _is_numeric(dtype) -> bool:
+
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+def _coerce_numeric(chunk: pd.DataFrame, numeric) -> tuple:
+
+    """
+    Converts the columns of numeric that are not numbers in chunk (e.g. a later chunk of pd.read_csv inferred as text)
+    with pd.to_numeric, the values that are not numbers become missing.
+
+    :return: (chunk, number of values that are not numbers of each converted column as Series)
+    """
+
+    invalid = {}
+    for column in numeric:
+        if column not in chunk.columns or _is_numeric(chunk[column].dtype):
+            continue
+        if not invalid:
+            chunk = chunk.copy()
+        values = pd.to_numeric(chunk[column].astype(object), errors="coerce")
+        invalid[column] = int((values.isnull() & chunk[column].notnull()).sum())
+        chunk[column] = values
+
+    return chunk, pd.Series(invalid, dtype=np.int64)
+
+def _warn_invalid(invalid: pd.Series):
+
+    import warnings
+
+    invalid = invalid[invalid > 0]
+    if len(invalid):
+        warnings.warn(f"values that are not numbers in numeric columns are not in their statistics: {invalid.to_dict()}",
+                      stacklevel=3)
+
+def _moments(values: np.ndarray) -> tuple:
+
+    """
+    Count, mean, sum of squared differences from the mean, min and max of each column of a float array, NaN ignored.
+    """
+
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    total = np.where(valid, values, 0).sum(axis=0)
+    mean = np.divide(total, count, out=np.zeros(len(count)), where=count > 0)
+    m2 = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+
+    return count, mean, m2, np.fmin.reduce(values, axis=0, initial=np.inf), np.fmax.reduce(values, axis=0, initial=-np.inf)
+
+def _merge_moments(a: tuple, b: tuple) -> tuple:
+
+    """
+    Merges the _moments of two parts of the same columns (Chan et al. parallel variance).
+    """
+
+    count_a, mean_a, m2_a, min_a, max_a = a
+    count_b, mean_b, m2_b, min_b, max_b = b
+
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    ratio = np.divide(count_b, count, out=np.zeros(len(count)), where=count > 0)
+
+    mean = mean_a + delta * ratio
+    m2 = m2_a + m2_b + delta ** 2 * count_a * ratio
+
+    return count, mean, m2, np.fmin(min_a, min_b), np.fmax(max_a, max_b)
+
+def _reservoir_update(reservoir, chunk: pd.DataFrame, seen: int, size: int, rng) -> pd.DataFrame:
+
+    """
+    Algorithm R over a chunk: after the update, the reservoir is a uniform sample of size rows of all rows seen.
+    The index of the reservoir is the slot number.
+    """
+
+    position = seen + np.arange(len(chunk))
+    slot = np.where(position < size, position, rng.integers(0, position + 1))
+    taken = np.flatnonzero(slot < size)
+
+    # A slot taken twice in the same chunk keeps the last row
+    slot = pd.Series(taken, index=slot[taken])
+    slot = slot[~slot.index.duplicated(keep="last")]
+
+    new = chunk.iloc[slot.to_numpy()].set_axis(slot.index, axis=0)
+
+    if reservoir is None:
+        return new
+
+    return pd.concat([reservoir.drop(index=slot.index, errors="ignore"), new])
+
+def profile(data, chunksize: int = 1000000, sample: int = None, head: int = 5, tail: int = 5, top: int = 10,
+            quantiles: list = (0, 0.05, 0.25, 0.95, 0.99, 1), quantile_sample: int = 100000, random_state: int = None) -> DataProfile:
+
+    """
+    Computes the sections of data_info in one chunked pass and returns them as a DataProfile instead of printing.
+    Counts, missing values, min / max and mean / std are exact, quantiles are computed from a uniform sample.
+    The numeric columns are the numeric columns of the first chunk. When a later chunk of such a column
+    is not numbers (e.g. pd.read_csv infers text for it), it is converted with pd.to_numeric and the values that are
+    not numbers are counted in invalid, with a warning.
+
+    :param data: dataframe, or an iterable of dataframes such as pd.read_csv(path, chunksize=100000)
+    :param chunksize: number of rows processed at a time when data is a dataframe
+    :param sample: if given, every statistic is computed on a uniform sample (reservoir sampling) of this many rows.
+                   Faster for very large data, rows and shape still count all rows.
+    :param head: number of first rows
+    :param tail: number of last rows
+    :param top: number of most frequent values of each categorical column
+    :param quantiles: quantiles to compute
+    :param quantile_sample: size of the sample for the quantiles when sample is not given
+    :param random_state: seed of the sampling
+    :return: DataProfile
+
+    Test and Example:
+
+    result = profile(data, sample=1000000)
+
+    print(result)
+
+    result.to_json("profile.json", indent=4)
+
+    profile(pd.read_csv("big.csv", chunksize=500000)).to_html()
+    """
+
+    if isinstance(data, pd.DataFrame):
+        chunks = (data.iloc[i:i + chunksize] for i in range(0, max(len(data), 1), chunksize))
+    else:
+        chunks = iter(data)
+
+    rng = np.random.default_rng(random_state)
+    size = sample or quantile_sample
+
+    rows = 0
+    first = None
+    last = []
+    reservoir = None
+    missing = None
+    moments = None
+    counts = {}
+    invalid = pd.Series(dtype=np.int64)
+
+    for chunk in chunks:
+
+        if first is None:
+            first = chunk.head(head)
+            numeric = chunk.select_dtypes(include=np.number).columns
+            categorical = chunk.select_dtypes(exclude=np.number).columns
+
+        last = [*last[-1:], chunk.tail(tail)]
+
+        # Head, tail and missing values are of the rows as read, the statistics of the converted values
+        values, chunk_invalid = _coerce_numeric(chunk, numeric)
+        invalid = invalid.add(chunk_invalid, fill_value=0).astype(np.int64)
+
+        reservoir = _reservoir_update(reservoir, values, rows, size, rng)
+        rows += len(chunk)
+
+        if sample:
+            continue
+
+        chunk_missing = chunk.isnull().sum()
+        missing = chunk_missing if missing is None else missing + chunk_missing
+
+        chunk_moments = _moments(values[numeric].to_numpy(dtype=float, na_value=np.nan))
+        moments = chunk_moments if moments is None else _merge_moments(moments, chunk_moments)
+
+        for i in categorical:
+            value_counts = chunk[i].value_counts()
+            counts[i] = value_counts if i not in counts else counts[i].add(value_counts, fill_value=0)
+
+    if first is None:
+        raise ValueError("data has no rows")
+
+    _warn_invalid(invalid)
+
+    if sample:
+        missing = reservoir.isnull().sum()
+        moments = _moments(reservoir[numeric].to_numpy(dtype=float, na_value=np.nan))
+        counts = {i: reservoir[i].value_counts() for i in categorical}
+
+    count, mean, m2, minimum, maximum = moments
+    has_values = count > 0
+    continuous = pd.DataFrame({"N": count,
+                               "Mean": np.where(has_values, mean, np.nan),
+                               "SD": np.sqrt(np.divide(m2, count - 1, out=np.full(len(count), np.nan), where=count > 1)),
+                               "Min": np.where(has_values, minimum, np.nan),
+                               "Max": np.where(has_values, maximum, np.nan)}, index=numeric)
+
+    summary = []
+    for i in categorical:
+        value_counts = counts[i].sort_values(ascending=False, kind="stable")
+        total = value_counts.sum()
+        for outcome, count in value_counts.head(top).items():
+            summary.append({"Variable": i, "Outcome": outcome, "Count": int(count), "Percent": 100 * count / total})
+    categorical = pd.DataFrame(summary, columns=["Variable", "Outcome", "Count", "Percent"])
+
+    quantile_values = reservoir[numeric].quantile(list(quantiles)).T if len(numeric) else pd.DataFrame()
+
+    # The smallest and the largest quantiles are known exactly
+    if len(numeric) and not sample:
+        for q, exact in ((0, continuous["Min"]), (1, continuous["Max"])):
+            if q in quantile_values.columns:
+                quantile_values[q] = exact
+
+    return DataProfile(rows=rows, dtypes=first.dtypes, head=first, tail=pd.concat(last).tail(tail), missing=missing,
+                       continuous=continuous, categorical=categorical, quantiles=quantile_values,
+                       sampled=bool(sample), sample_size=len(reservoir), invalid=invalid)
+
+# Incremental profile
+
+def _sketch_compact(levels: list, size: int, rng) -> list:
+
+    """
+    Compacts a quantile sketch, a list of arrays where an item of level h stands for 2 ** h values.
+    A level longer than size is sorted and every other item, from a random start, moves to the next level.
+    """
+
+    h = 0
+    while h < len(levels):
+        if len(levels[h]) > size:
+            items = np.sort(levels[h])
+            even = len(items) - len(items) % 2
+            if h + 1 == len(levels):
+                levels.append(np.empty(0))
+            levels[h + 1] = np.concatenate([levels[h + 1], items[rng.integers(0, 2):even:2]])
+            levels[h] = items[even:]
+        h += 1
+
+    return levels
+
+def _sketch_quantiles(levels: list, quantiles: list) -> np.ndarray:
+
+    """
+    Approximate quantiles of a quantile sketch, exact while all values are on the first level.
+    """
+
+    if len(levels) == 1:
+        return np.quantile(levels[0], quantiles) if len(levels[0]) else np.full(len(quantiles), np.nan)
+
+    items = np.concatenate(levels)
+    weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(levels)])
+
+    order = np.argsort(items, kind="stable")
+    cumulative = np.cumsum(weights[order])
+    position = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1], side="left")
+
+    return items[order][np.minimum(position, len(items) - 1)]
+
+class ProfileState:
+
+    """
+    Mergeable statistics of the data_info sections, for data that grows by appends.
+    update adds the new rows only, so the cost of a daily profile depends on the size of the new data,
+    not on the size of the whole table. The state is saved between runs with save and load.
+
+    Counts, missing values, mean / SD (parallel Welford) and min / max are exact. Category frequencies are exact
+    while a column has at most max_categories values, then only the most frequent ones are kept
+    and the others are counted together. Quantiles come from a mergeable sketch of sketch_size items per level,
+    they are exact until a column has more than sketch_size values.
+
+    A column is numeric or categorical by its type in the first rows that have it. When later rows of a numeric
+    column are not numbers, they are converted with pd.to_numeric and the values that are not numbers
+    are counted in invalid, with a warning.
+
+    :param head: number of first rows
+    :param tail: number of last rows
+    :param top: number of most frequent values of each categorical column
+    :param quantiles: quantiles to compute
+    :param sketch_size: items per level of the quantile sketch, larger is more accurate
+    :param max_categories: number of distinct values kept per categorical column
+    :param random_state: seed of the quantile sketch
+
+    Test and Example:
+
+    state = ProfileState.load("profile.pkl") if os.path.exists("profile.pkl") else ProfileState()
+
+    state.update(new_rows)
+
+    state.save("profile.pkl")
+
+    data_info(state)
+    """
+
+    def __init__(self, head: int = 5, tail: int = 5, top: int = 10, quantiles: list = (0, 0.05, 0.25, 0.95, 0.99, 1),
+                 sketch_size: int = 2048, max_categories: int = 10000, random_state: int = None):
+
+        self.head = head
+        self.tail = tail
+        self.top = top
+        self.quantiles = list(quantiles)
+        self.sketch_size = sketch_size
+        self.max_categories = max_categories
+        self.rng = np.random.default_rng(random_state)
+
+        self.rows = 0
+        self.dtypes = pd.Series(dtype=object)
+        self.first = None
+        self.last = None
+        self.missing = pd.Series(dtype=np.int64)
+        self.invalid = pd.Series(dtype=np.int64)
+        self.moments = pd.DataFrame(columns=["count", "mean", "m2", "min", "max"], dtype=float)
+        self.counts = {}
+        self.other = {}
+        self.sketches = {}
+
+    def _add_counts(self, column, counts: pd.Series, other: int = 0):
+
+        if column in self.counts:
+            counts = self.counts[column].add(counts, fill_value=0)
+        other += self.other.get(column, 0)
+
+        # Only the most frequent values are kept, the others are counted together
+        if len(counts) > self.max_categories:
+            counts = counts.sort_values(ascending=False, kind="stable")
+            other += counts.iloc[self.max_categories:].sum()
+            counts = counts.iloc[:self.max_categories]
+
+        self.counts[column] = counts
+        self.other[column] = other
+
+    def _add_moments(self, moments: pd.DataFrame):
+
+        empty = {"count": 0, "mean": 0, "m2": 0, "min": np.inf, "max": -np.inf}
+        index = self.moments.index.union(moments.index, sort=False)
+        a = self.moments.reindex(index).fillna(empty)
+        b = moments.reindex(index).fillna(empty)
+
+        merged = _merge_moments(tuple(a[i].to_numpy(dtype=float) for i in empty),
+                                tuple(b[i].to_numpy(dtype=float) for i in empty))
+        self.moments = pd.DataFrame(dict(zip(empty, merged)), index=index)
+
+    def _add_sketch(self, column, levels: list):
+
+        if column not in self.sketches:
+            self.sketches[column] = [np.empty(0)]
+        current = self.sketches[column]
+
+        for h, level in enumerate(levels):
+            if h == len(current):
+                current.append(np.empty(0))
+            current[h] = np.concatenate([current[h], level])
+
+        self.sketches[column] = _sketch_compact(current, self.sketch_size, self.rng)
+
+    def update(self, data, chunksize: int = 1000000) -> "ProfileState":
+
+        """
+        Adds rows to the statistics.
+
+        :param data: new rows as dataframe, or an iterable of dataframes such as pd.read_csv(path, chunksize=100000)
+        :param chunksize: number of rows processed at a time when data is a dataframe
+        :return: self
+        """
+
+        if isinstance(data, pd.DataFrame):
+            chunks = (data.iloc[i:i + chunksize] for i in range(0, len(data), chunksize))
+        else:
+            chunks = iter(data)
+
+        invalid = pd.Series(dtype=np.int64)
+
+        for chunk in chunks:
+            new = chunk.dtypes[~chunk.dtypes.index.isin(self.dtypes.index)]
+            self.dtypes = pd.concat([self.dtypes, new]) if len(self.dtypes) else new
+
+            # The kind of a column is fixed by the first rows that have it
+            kinds = self.dtypes.reindex(chunk.columns).map(_is_numeric).to_numpy(dtype=bool)
+
+            self.first = chunk.head(self.head) if self.first is None else \
+                pd.concat([self.first, chunk.head(self.head - len(self.first))])
+            self.last = chunk.tail(self.tail) if self.last is None else \
+                pd.concat([self.last, chunk.tail(self.tail)]).tail(self.tail)
+
+            # A column that is not in every chunk is missing in the rows of the others
+            self.missing = (self.missing.reindex(self.dtypes.index, fill_value=self.rows) +
+                            chunk.isnull().sum().reindex(self.dtypes.index, fill_value=len(chunk))).astype(np.int64)
+            self.rows += len(chunk)
+
+            numeric, chunk_invalid = _coerce_numeric(chunk[chunk.columns[kinds]], chunk.columns[kinds])
+            invalid = invalid.add(chunk_invalid, fill_value=0).astype(np.int64)
+
+            values = numeric.to_numpy(dtype=float, na_value=np.nan)
+            self._add_moments(pd.DataFrame(dict(zip(["count", "mean", "m2", "min", "max"], _moments(values))),
+                                           index=numeric.columns))
+            for k, column in enumerate(numeric.columns):
+                column_values = values[:, k]
+                self._add_sketch(column, [column_values[~np.isnan(column_values)]])
+
+            for column in chunk.columns[~kinds]:
+                self._add_counts(column, chunk[column].value_counts())
+
+        self.invalid = self.invalid.add(invalid, fill_value=0).astype(np.int64)
+        _warn_invalid(invalid)
+
+        return self
+
+    def merge(self, other: "ProfileState") -> "ProfileState":
+
+        """
+        Adds the statistics of other, the rows of other are after the rows of self.
+
+        :param other: ProfileState of other rows of the same table
+        :return: self
+        """
+
+        if other.first is None:
+            return self
+
+        common = self.dtypes.index.intersection(other.dtypes.index)
+        different = [i for i in common if _is_numeric(self.dtypes[i]) != _is_numeric(other.dtypes[i])]
+        if different:
+            raise ValueError(f"columns {different} are numeric in one ProfileState and categorical in the other")
+
+        new = other.dtypes[~other.dtypes.index.isin(self.dtypes.index)]
+        self.dtypes = pd.concat([self.dtypes, new]) if len(self.dtypes) else new
+
+        self.first = other.first.head(self.head) if self.first is None else \
+            pd.concat([self.first, other.first.head(self.head - len(self.first))])
+        self.last = other.last if self.last is None else pd.concat([self.last, other.last]).tail(self.tail)
+
+        self.missing = (self.missing.reindex(self.dtypes.index, fill_value=self.rows) +
+                        other.missing.reindex(self.dtypes.index, fill_value=other.rows)).astype(np.int64)
+        self.rows += other.rows
+        self.invalid = self.invalid.add(other.invalid, fill_value=0).astype(np.int64)
+        self._add_moments(other.moments)
+        for column, levels in other.sketches.items():
+            self._add_sketch(column, levels)
+        for column, counts in other.counts.items():
+            self._add_counts(column, counts, other.other.get(column, 0))
+
+        return self
+
+    def to_profile(self) -> DataProfile:
+
+        """
+        Returns the statistics as a DataProfile, with the same sections as data_info.
+        """
+
+        if self.first is None:
+            raise ValueError("ProfileState has no rows")
+
+        numeric = [i for i in self.dtypes.index if _is_numeric(self.dtypes[i])]
+        moments = self.moments.reindex(numeric)
+
+        count = moments["count"].fillna(0).to_numpy().astype(np.int64)
+        has_values = count > 0
+        continuous = pd.DataFrame({"N": count,
+                                   "Mean": np.where(has_values, moments["mean"], np.nan),
+                                   "SD": np.sqrt(np.divide(moments["m2"].to_numpy(), count - 1,
+                                                           out=np.full(len(count), np.nan), where=count > 1)),
+                                   "Min": np.where(has_values, moments["min"], np.nan),
+                                   "Max": np.where(has_values, moments["max"], np.nan)}, index=numeric)
+
+        summary = []
+        for i in self.dtypes.index:
+            if i in numeric or i not in self.counts:
+                continue
+            value_counts = self.counts[i].sort_values(ascending=False, kind="stable")
+            total = value_counts.sum() + self.other[i]
+            for outcome, count in value_counts.head(self.top).items():
+                summary.append({"Variable": i, "Outcome": outcome, "Count": int(count), "Percent": 100 * count / total})
+        categorical = pd.DataFrame(summary, columns=["Variable", "Outcome", "Count", "Percent"])
+
+        quantiles = pd.DataFrame([_sketch_quantiles(self.sketches.get(i, [np.empty(0)]), self.quantiles) for i in numeric],
+                                 index=numeric, columns=self.quantiles)
+
+        # The smallest and the largest quantiles are known exactly
+        for q, exact in ((0, continuous["Min"]), (1, continuous["Max"])):
+            if q in quantiles.columns:
+                quantiles[q] = exact
+
+        return DataProfile(rows=self.rows, dtypes=self.dtypes, head=self.first, tail=self.last,
+                           missing=self.missing, continuous=continuous,
+                           categorical=categorical, quantiles=quantiles, sampled=False,
+                           sample_size=sum(len(level) for levels in self.sketches.values() for level in levels),
+                           invalid=self.invalid)
+
+    def __str__(self) -> str:
+
+        return str(self.to_profile())
+
+    def save(self, path: str):
+
+        """
+        Saves the state with pickle, load it only from trusted files.
+        """
+
+        import pickle
+
+        with open(path, "wb") as file:
+            pickle.dump(self, file)
+
+    def __setstate__(self, state: dict):
+
+        # States saved before the invalid values were counted
+        state.setdefault("invalid", pd.Series(dtype=np.int64))
+        self.__dict__.update(state)
+
+    @classmethod
+    def load(cls, path: str) -> "ProfileState":
+
+        import pickle
+
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
 ########################################################################################################################
 ########################################################################################################################
 
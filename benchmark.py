@@ -0,0 +1,264 @@
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import be
+import data
+
+"""
+This module contains a benchmark harness for the functions of data and be.
+It generates synthetic data, measures the time and the peak memory of every function and saves the results as JSON,
+so two runs can be compared and a slowdown can be detected.
+
+Usage:
+
+python benchmark.py --sizes 10k 1m --output results.json
+
+python benchmark.py --sizes 10k --output new.json --baseline results.json --tolerance 0.2
+"""
+
+SIZES = {"10k": 10000, "1m": 1000000, "10m": 10000000}
+
+WORDS = ["patient", "test", "result", "value", "level", "glucose", "hemoglobin", "fever", "cough", "pain",
+         "smoker", "non", "denies", "history", "normal", "high", "low", "tanı", "ağrı", "ateş"]
+
+RTF = r"{\rtf1\ansi{\fonttbl\f0\fswiss Helvetica;}\f0\pard Note %d: {\b %s} result.\par}"
+
+########################################################################################################################
+########################################################################################################################
+# Synthetic data
+########################################################################################################################
+########################################################################################################################
+
+def make_data(rows: int, cardinality: int = 100, text_length: int = 20, rtf_unique: int = 1000, seed: int = 0) -> pd.DataFrame:
+
+    """
+    Generates a dataframe with a column for every function of the benchmark.
+
+    :param rows: number of rows
+    :param cardinality: number of distinct values of the categorical column
+    :param text_length: average number of words of the text column
+    :param rtf_unique: number of distinct rich text values
+    :param seed: seed of the random generator
+    :return: dataframe with CAT, VALUE, NUM_TEXT, RTF and TEXT columns
+    """
+
+    rng = np.random.default_rng(seed)
+
+    categories = np.array([f"TEST_{i}" for i in range(cardinality)], dtype=object)
+
+    # Numbers as text, some of them with a repeated separator such as 12.12.00
+    numbers = rng.integers(0, 1000, rows).astype(str).astype(object)
+    repeated = rng.random(rows) < 0.2
+    numbers = np.where(repeated, numbers + ".00.00", numbers + ".5")
+
+    templates = np.array([RTF % (i, WORDS[i % len(WORDS)]) for i in range(rtf_unique)], dtype=object)
+
+    # Text of words with some numbers, lengths vary around text_length
+    words = np.array(WORDS + [str(i) for i in range(10, 100)], dtype=object)
+    lengths = np.maximum(rng.poisson(text_length, rows), 1)
+    tokens = words[rng.integers(0, len(words), lengths.sum())]
+    text = [" ".join(tokens[end - length:end]) + "." for end, length in zip(np.cumsum(lengths), lengths)]
+
+    return pd.DataFrame({"CAT": categories[rng.integers(0, cardinality, rows)],
+                         "VALUE": rng.normal(100, 15, rows),
+                         "NUM_TEXT": numbers,
+                         "RTF": templates[rng.integers(0, rtf_unique, rows)],
+                         "TEXT": text})
+
+########################################################################################################################
+########################################################################################################################
+# Cases
+########################################################################################################################
+########################################################################################################################
+
+def _snapshot(frame):
+
+    # Saves the frame and loads two of its columns back from the mapped file
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "snapshot.arrow")
+    try:
+        be.save_snapshot(frame, path)
+        be.Snapshot(path)[["CAT", "VALUE"]]
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+def _data_info(frame):
+
+    # data_info prints every section, the output is not a part of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        be.data_info(frame)
+
+CASES = {"cat2var": lambda frame: data.cat2var(frame, "CAT", "VALUE"),
+         "cat2var_sparse": lambda frame: data.cat2var(frame, "CAT", "VALUE", sparse=True),
+         "cat2var_compact": lambda frame: data.cat2var(frame, "CAT", "NUM_TEXT", compact=True),
+         "del_repeated_last_occur_str": lambda frame: data.del_repeated_last_occur_str(frame, ".", "NUM_TEXT", to_numeric=True),
+         "rft2text": lambda frame: data.rft2text(frame, "RTF", unique=True),
+         "text2bincat": lambda frame: data.text2bincat(frame, "TEXT", ["fever", "cough"], ["denies", "normal"]),
+         "text2multicat": lambda frame: data.text2multicat(frame, "TEXT", "patient", threshold=3),
+         "extract_numbers_from_text": lambda frame: data.extract_numbers_from_text(frame, "TEXT"),
+         "extract_numbers_from_text_long": lambda frame: data.extract_numbers_from_text(frame, "TEXT", long=True),
+         "token_store": lambda frame: data.TokenStore(frame["TEXT"]),
+         "data_info": _data_info,
+         "profile": lambda frame: be.profile(frame),
+         "profile_state": lambda frame: be.ProfileState().update(frame).to_profile(),
+         "optimize_dtypes": lambda frame: be.optimize_dtypes(frame),
+         "snapshot": _snapshot}
+
+########################################################################################################################
+########################################################################################################################
+# Measurement
+########################################################################################################################
+########################################################################################################################
+
+def measure(func, frame: pd.DataFrame, repeat: int = 3) -> dict:
+
+    """
+    Runs func on a copy of frame repeat times for the time, and once more with tracemalloc for the peak memory,
+    because tracing the allocations slows the function down.
+
+    :param func: function of one dataframe
+    :param frame: input dataframe
+    :param repeat: number of timed runs, the best time is reported
+    :return: dict with seconds (best), mean_seconds, peak_memory_mb (tracemalloc) and error
+    """
+
+    times = []
+
+    try:
+        for _ in range(repeat):
+            copy = frame.copy()
+            start = time.perf_counter()
+            func(copy)
+            times.append(time.perf_counter() - start)
+
+        copy = frame.copy()
+        tracemalloc.start()
+        try:
+            func(copy)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as error:
+        return {"seconds": None, "mean_seconds": None, "peak_memory_mb": None, "error": f"{type(error).__name__}: {error}"}
+
+    return {"seconds": min(times), "mean_seconds": sum(times) / len(times), "peak_memory_mb": peak / 2 ** 20, "error": None}
+
+def import_time(modules: list = ("data", "be")) -> float:
+
+    """
+    Measures the cold import time of modules in a new interpreter.
+
+    :param modules: module names
+    :return: seconds
+    """
+
+    import subprocess
+    from os.path import abspath, dirname
+
+    code = f"import time; start = time.perf_counter(); import {', '.join(modules)}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=dirname(abspath(__file__)))
+
+    return float(result.stdout)
+
+def run(sizes: list = ("10k",), cases: list = None, repeat: int = 3, cardinality: int = 100, text_length: int = 20,
+        output: str = None) -> dict:
+
+    """
+    Runs the cases for every size and optionally saves the results as JSON.
+
+    :param sizes: keys of SIZES or numbers of rows
+    :param cases: keys of CASES, None runs all of them
+    :param repeat: same as measure
+    :param cardinality: same as make_data
+    :param text_length: same as make_data
+    :param output: path of the JSON file
+    :return: results as dict
+    """
+
+    results = {"python": platform.python_version(),
+               "pandas": pd.__version__,
+               "numpy": np.__version__,
+               "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "import_seconds": import_time(),
+               "results": []}
+
+    for size in sizes:
+        rows = SIZES.get(size, size)
+        frame = make_data(int(rows), cardinality=cardinality, text_length=text_length)
+
+        for name in cases or CASES:
+            result = {"case": name, "size": str(size), "rows": int(rows), **measure(CASES[name], frame, repeat)}
+            results["results"].append(result)
+            print(f"{name:30} {size:>6} " + (f"{result['seconds']:10.4f} s {result['peak_memory_mb']:10.1f} MB"
+                                             if result["error"] is None else result["error"].strip().splitlines()[0]))
+
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+    return results
+
+def compare(baseline: dict or str, current: dict or str, tolerance: float = 0.2) -> list:
+
+    """
+    Compares two results of run. A case is a regression when it is slower than the baseline by more than tolerance.
+
+    :param baseline: results as dict or path of the JSON file
+    :param current: results as dict or path of the JSON file
+    :param tolerance: allowed slowdown as ratio, 0.2 allows 20 percent
+    :return: regressions as list of dict with case, size, baseline, current and ratio
+    """
+
+    if isinstance(baseline, str):
+        with open(baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    if isinstance(current, str):
+        with open(current, encoding="utf-8") as file:
+            current = json.load(file)
+
+    before = {(i["case"], i["size"]): i["seconds"] for i in baseline["results"] if i["seconds"]}
+
+    regressions = []
+    for i in current["results"]:
+        old = before.get((i["case"], i["size"]))
+        if old and i["seconds"] and i["seconds"] > old * (1 + tolerance):
+            regressions.append({"case": i["case"], "size": i["size"], "baseline": old, "current": i["seconds"],
+                                "ratio": i["seconds"] / old})
+
+    return regressions
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark of the data and be functions")
+    parser.add_argument("--sizes", nargs="+", default=["10k"], help="keys of SIZES (10k, 1m, 10m) or numbers of rows")
+    parser.add_argument("--cases", nargs="+", default=None, choices=list(CASES), help="cases to run, default all")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cardinality", type=int, default=100)
+    parser.add_argument("--text-length", type=int, default=20)
+    parser.add_argument("--output", default=None, help="path of the JSON results")
+    parser.add_argument("--baseline", default=None, help="path of JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    current = run([i if i in SIZES else int(i) for i in args.sizes], args.cases, args.repeat, args.cardinality,
+                  args.text_length, args.output)
+
+    if args.baseline:
+        regressions = compare(args.baseline, current, args.tolerance)
+        for i in regressions:
+            print(f"Regression: {i['case']} {i['size']} {i['baseline']:.4f} s -> {i['current']:.4f} s ({i['ratio']:.2f}x)")
+        sys.exit(1 if regressions else 0)
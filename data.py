@@ -1,16 +1,133 @@
 # unstructured class
+import re
+import sys
 import time
+from contextvars import ContextVar
+from functools import lru_cache, partial
 
 import numpy as np
 import pandas as pd
 
-import be
-
 """
 This module contains functions that can be used when dealing with data cleaning for unstructured data 
 """
 
-def cat2var(data, cat_column, var_column, suffix: str = None, prefix: str = None, inplace: bool = False ):
+def _new_col_name(name, suffix: str = None, prefix: str = None, default: str = None):
+
+    """
+    Builds a new column name with the suffix / prefix rule shared by the functions of this module.
+
+    :param name: base name (column name or category value)
+    :param suffix: add suffix to new column name as string
+    :param prefix: add prefix to new column name as string
+    :param default: suffix to use when neither suffix nor prefix is given, None keeps the name as it is
+    :return: new column name
+    """
+
+    if suffix:
+        return name + suffix
+    elif prefix:
+        return prefix + name
+    elif default:
+        return name + default
+
+    return name
+
+# Working dataframe of the running Pipeline step, the step may return a new dataframe instead of changing it
+_PIPELINE_FRAME = ContextVar("pipeline_frame", default=None)
+
+def _assign_columns(data, new_data, inplace: bool = False):
+
+    """
+    Adds the columns of new_data to data. Columns that already exist are overwritten in their position.
+
+    Without inplace the new columns are added with one pd.concat, so they stay one block and the dataframe is not
+    fragmented. With inplace the caller's dataframe must be changed, pandas has no public way to add many columns
+    to it at once, so they are assigned one by one (slower when there are hundreds of new columns).
+    The working dataframe of a Pipeline is owned by the Pipeline, which uses the returned dataframe,
+    so its columns are added with pd.concat also with inplace.
+
+    :param data: dataframe as pandas dataframe, already a copy when inplace is False
+    :param new_data: dataframe with the same index as data
+    :param inplace: same as the functions that call it
+    :return: data as dataframe
+    """
+
+    import warnings
+
+    existing = [col for col in new_data.columns if col in data.columns]
+    for col in existing:
+        data[col] = new_data[col]
+
+    added = [col for col in new_data.columns if col not in data.columns]
+    if not added:
+        return data
+    if len(added) < len(new_data.columns):
+        new_data = new_data[added]
+
+    if not inplace or _PIPELINE_FRAME.get() is data:
+        return pd.concat([data, new_data], axis=1, copy=False)
+
+    # The fragmentation warning is expected here, the columns are added one by one on purpose
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+        data[added] = new_data
+
+    return data
+
+def _compact_columns(values: np.ndarray, rows: np.ndarray, codes: np.ndarray, length: int, width: int) -> dict:
+
+    """
+    Builds the columns of cat2var with compact dtypes. Integers become the smallest nullable integer of their range,
+    booleans become boolean and objects with few distinct values (at most half of the rows) become category
+    with the same categories in every column. Floats and the other objects are kept with NaN as missing value.
+
+    :param values: values of the value column as numpy array
+    :param rows: positions of the rows with a category
+    :param codes: position of the category of each row of rows
+    :param length: number of rows
+    :param width: number of categories
+    :return: columns as dict, keyed by the position of the category
+    """
+
+    kind = values.dtype.kind
+
+    if kind == "O":
+        labels, uniques = pd.factorize(values[rows])
+        if len(uniques) > len(rows) / 2:
+            kind = "f"
+
+    if kind not in "biuO":
+        block = np.full((length, width), np.NaN, dtype=np.where(np.zeros(0, dtype=bool), values[:0], np.NaN).dtype, order="F")
+        block[rows, codes] = values[rows]
+        return {k: block[:, k] for k in range(width)}
+
+    # Fortran order keeps every column contiguous, the arrays below are views of the block
+    mask = np.ones((length, width), dtype=bool, order="F")
+    mask[rows, codes] = False
+
+    if kind == "b":
+        block = np.zeros((length, width), dtype=bool, order="F")
+        block[rows, codes] = values[rows]
+        return {k: pd.arrays.BooleanArray(block[:, k], mask[:, k]) for k in range(width)}
+
+    if kind in "iu":
+        used = values[rows]
+        low, high = (used.min(), used.max()) if len(used) else (0, 0)
+        types = (np.uint8, np.uint16, np.uint32, np.uint64) if low >= 0 else (np.int8, np.int16, np.int32, np.int64)
+        dtype = next(i for i in types if np.iinfo(i).min <= low and high <= np.iinfo(i).max)
+        block = np.zeros((length, width), dtype=dtype, order="F")
+        block[rows, codes] = used
+        return {k: pd.arrays.IntegerArray(block[:, k], mask[:, k]) for k in range(width)}
+
+    dtype = pd.CategoricalDtype(uniques)
+    block = np.full((length, width), -1, dtype=np.result_type(np.int8, np.min_scalar_type(len(uniques))), order="F")
+    block[rows, codes] = labels
+
+    return {k: pd.Categorical.from_codes(block[:, k], dtype=dtype) for k in range(width)}
+
+def cat2var(data, cat_column, var_column, suffix: str = None, prefix: str = None, inplace: bool = False, sparse: bool = False, categories: list = None,
+            compact: bool = False):
 
     """
 
@@ -22,6 +139,27 @@ def cat2var(data, cat_column, var_column, suffix: str = None, prefix: str = None
 
     You can use this function at that time.
 
+    All category columns are built in one grouped pass: every row is mapped to the code of its category once
+    and the values are scattered into a single block, which is then added to the dataframe in one assignment
+    (one by one with inplace, see _assign_columns).
+    The output is the same as looping over the categories with numpy where, without fragmenting the dataframe.
+
+    :param data: dataframe as pandas dataframe
+    :param cat_column: categorical column name as string
+    :param var_column: value column name as string
+    :param suffix: add suffix to new column names as string
+    :param prefix: add prefix to new column names as string
+    :param inplace: same as other libraries
+    :param sparse: if True, new columns are created as sparse columns with NaN as fill value.
+                   Useful when there are many categories and most of the cells are NaN.
+    :param categories: list of categories to materialize. Only these columns are created, in the given order.
+                       A category that is not present in the column gives an all NaN column.
+    :param compact: if True, the new columns keep the type of the values instead of becoming float with NaN.
+                    Integers become the smallest nullable integer (Int8, UInt16 ...), booleans become boolean
+                    and text with few distinct values becomes category. Float values are not changed.
+                    It can not be used with sparse.
+    :return: data as dataframe
+
     You can test it before using it with the example below.
     # https://stackoverflow.com/questions/48027171/create-a-variable-in-a-pandas-dataframe-based-on-information-in-the-dataframe
 
@@ -36,32 +174,66 @@ def cat2var(data, cat_column, var_column, suffix: str = None, prefix: str = None
 
     data = pd.DataFrame(dataframe)
 
-    cat_to_var(data,"B","C", suffix="_deneme", inplace=True)
+    cat2var(data,"B","C", suffix="_deneme", inplace=True)
 
     data.head()
 
     """
 
+    if sparse and compact:
+        raise ValueError("sparse and compact parameters can not be both True")
+
     # Create a copy of the dataframe if inplace is not set
     if not inplace:
         data = data.copy()
 
-    # Iterate through unique values in the categorical column
-    for j in data[cat_column].unique():
-        # Create the new column name
-        if suffix:
-            new_col = j + suffix
-        elif prefix:
-            new_col = prefix + j
-        else:
-            new_col = j
+    cat = data[cat_column]
 
-        # Assign the values from the variable column to the new column
-        data[new_col] = np.where(data[cat_column] == j, data[var_column], np.NaN)
+    if categories is None:
+        cats = cat.unique()
+    else:
+        cats = pd.unique(pd.Series(list(categories), dtype=object))
+        if len(cats) != len(categories):
+            raise ValueError("categories parameter must not contain duplicated values")
+
+    # Map every row to the position of its category, rows without a category get -1.
+    # The dtype is explicit, given categories are objects and must not be inferred again as numbers.
+    codes = pd.Index(cats, dtype=cat.dtype if categories is None else object).get_indexer(cat)
+    codes[cat.isna().to_numpy()] = -1
+
+    values = np.asarray(data[var_column])
+    dtype = np.where(np.zeros(0, dtype=bool), values[:0], np.NaN).dtype
+
+    rows = np.flatnonzero(codes >= 0)
+    new_cols = [_new_col_name(j, suffix, prefix) for j in cats]
+
+    if sparse:
+        # Group the rows by category with a stable sort, so every column is sliced out of one pass
+        order = rows[np.argsort(codes[rows], kind="stable")]
+        bounds = np.searchsorted(codes[order], np.arange(len(cats) + 1))
+
+        # Every sparse column is built from one reused dense buffer, only one dense column is in memory at a time
+        sparse_dtype = pd.SparseDtype(dtype, np.NaN)
+        buffer = np.full(len(data), np.NaN, dtype=dtype)
+        new_data = {}
+        for k in range(len(cats)):
+            idx = order[bounds[k]:bounds[k + 1]]
+            buffer[idx] = values[idx]
+            new_data[k] = pd.arrays.SparseArray(buffer, fill_value=np.NaN, dtype=sparse_dtype)
+            buffer[idx] = np.NaN
+        new_data = pd.DataFrame(new_data, index=data.index)
+        new_data.columns = new_cols
+    elif compact:
+        new_data = pd.DataFrame(_compact_columns(values, rows, codes[rows], len(data), len(cats)), index=data.index)
+        new_data.columns = new_cols
+    else:
+        block = np.full((len(data), len(cats)), np.NaN, dtype=dtype)
+        block[rows, codes[rows]] = values[rows]
+        new_data = pd.DataFrame(block, index=data.index, columns=new_cols)
 
-    return data
+    return _assign_columns(data, new_data, inplace)
 
-def del_repeated_last_occur_str(data, char, column, inplace: bool = False):
+def del_repeated_last_occur_str(data, char, column, inplace: bool = False, to_numeric: bool = False, strict: bool = True):
 
     """
 
@@ -73,6 +245,9 @@ def del_repeated_last_occur_str(data, char, column, inplace: bool = False):
     :param char: want to convert character as string
     :param column: want to implement apply columns as string
     :param inplace: same as other libraries
+    :param to_numeric: if True, the cleaned column is converted to float in the same step
+    :param strict: if True, raises ValueError when the character is not in any value of the column.
+                   If False, such a column is kept as it is, e.g. for a partition of a larger data.
     :return: return data as dataframe
 
     Test and Example:
@@ -88,6 +263,8 @@ def del_repeated_last_occur_str(data, char, column, inplace: bool = False):
 
     del_repeated_last_occur_str(data,".","TEST", inplace = True)
 
+    del_repeated_last_occur_str(data,".","TEST", to_numeric = True)
+
     The above code is a function to remove the last occurrence of a repeated string in a specific column of a DataFrame.
     When you want to convert the 'TEST' column to float, it will give an error because of unwanted characters.
     If you do not want to replace all the characters with methods like replace(),
@@ -107,23 +284,100 @@ def del_repeated_last_occur_str(data, char, column, inplace: bool = False):
     if not inplace:
         data = data.copy()
 
-    if data[column].str.contains(char).any():
-        for i in data.index:
-            if data.loc[i, column].count(char) > 1:
-                data.loc[i, column] = data.loc[i, column][:data.loc[i, column].rindex(char)]
-    else:
+    values = data[column]
+
+    # Count the character once for the whole column, the character is searched literally not as regex
+    counts = values.str.count(re.escape(char))
+
+    if strict and not (counts > 0).any():
         raise ValueError("The character is not present in the column values.")
 
+    # Only the rows with more than one occurrence are touched
+    repeated = counts > 1
+    if repeated.any():
+        values = values.copy()
+        values[repeated] = values[repeated].str.rpartition(char)[0]
+
+    if to_numeric:
+        values = pd.to_numeric(values).astype(float)
+
+    data[column] = values
+
     return data
 
 
+def _map_values(values, func, unique: bool = False, n_jobs: int = 1, chunksize: int = 100, progress: bool = False,
+                pool=None, errors: dict = None):
+
+    """
+    Applies func to every value of a series and keeps the original row order.
+
+    :param values: series to convert
+    :param func: function of one value, must be picklable (module level function or partial) when n_jobs is not 1
+    :param unique: if True, func is called once per distinct value and the results are mapped back to the rows
+    :param n_jobs: number of worker processes, -1 uses all cores, 1 runs in the current process
+    :param chunksize: number of values sent to a worker process at a time
+    :param progress: if True, shows a progress bar. It uses the tqdm library.
+    :param pool: WorkerPool, func runs in its workers instead and n_jobs and chunksize are not used.
+                 A value that fails gives NaN instead of raising.
+    :param errors: dict filled with the row position and the error message of every failed row, when pool is given
+    :return: series with the same index as values
+    """
+
+    if unique:
+        codes, items = pd.factorize(values, use_na_sentinel=False)
+    else:
+        codes, items = None, values.to_numpy()
+
+    if pool is not None:
+        converted, failed = pool.map(func, items, progress=progress)
+
+        if errors is not None and failed:
+            positions = np.fromiter(failed, dtype=np.int64, count=len(failed))
+            rows = np.flatnonzero(np.isin(codes, positions)) if unique else positions
+            errors.update({row: failed[codes[row] if unique else row] for row in rows})
+
+        if unique:
+            converted = converted[codes]
+
+        return pd.Series(converted, index=values.index, name=values.name)
+
+    if n_jobs == 1:
+        executor = None
+        results = map(func, items)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=None if n_jobs == -1 else n_jobs)
+        results = executor.map(func, items, chunksize=chunksize)
+
+    if progress:
+        from tqdm import tqdm
+        # pip install tqdm
+
+        results = tqdm(results, total=len(items))
+
+    try:
+        converted = np.empty(len(items), dtype=object)
+        for i, result in enumerate(results):
+            converted[i] = result
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if unique:
+        converted = converted[codes]
+
+    return pd.Series(converted, index=values.index, name=values.name)
+
 ########################################################################################################################
 ########################################################################################################################
 # Rich text format to text
 ########################################################################################################################
 ########################################################################################################################
 
-def rft2text(data, column, inplace: bool = False, isnull: bool = False, suffix: str = None, prefix: str = None, error: str = "strict"):
+def rft2text(data, column, inplace: bool = False, isnull: bool = False, suffix: str = None, prefix: str = None, error: str = "strict",
+             unique: bool = False, n_jobs: int = 1, chunksize: int = 100, progress: bool = False, pool=None):
 
     from striprtf.striprtf import rtf_to_text
     # pip install striprtf
@@ -146,6 +400,14 @@ def rft2text(data, column, inplace: bool = False, isnull: bool = False, suffix:
                   but it may cause data loss
                   How to handle encoding errors. Default is "strict", which throws an error. 
                   Another option is "ignore" which, as the name says, ignores encoding errors.
+    :param unique: if True, each distinct value is converted only once and the result is mapped back to the rows.
+                   Useful when many rows contain the same rich text, e.g. templates.
+    :param n_jobs: number of worker processes for the conversion, -1 uses all cores. 1 converts in the current process.
+    :param chunksize: number of values sent to a worker process at a time
+    :param progress: if True, shows a progress bar during the conversion. It uses the tqdm library.
+    :param pool: WorkerPool to convert in its subprocesses with its time and memory limits, n_jobs is not used.
+                 A row that can not be converted gets NaN and is added to pool.quarantine with its error,
+                 instead of stopping the conversion of the column.
 
     :return: dataframe
 
@@ -176,31 +438,370 @@ def rft2text(data, column, inplace: bool = False, isnull: bool = False, suffix:
     encoding="utf8"
     '''
 
-    if inplace:
+    # Create a copy of the dataframe if inplace is not set
+    if not inplace:
         data = data.copy()
 
     if isnull:
-        data[column].fillna("", inplace=True)
+        data[column] = data[column].fillna("")
 
     # Create the new column name
-    if suffix:
-        new_col = data[column].name + suffix
-    elif prefix:
-        new_col = prefix + data[column].name
-    else:
-        new_col = data[column].name + "_rft2text"
+    new_col = _new_col_name(data[column].name, suffix, prefix, "_rft2text")
+
+    errors = {}
+    data[new_col] = _map_values(data[column], partial(rtf_to_text, errors=error), unique=unique, n_jobs=n_jobs,
+                                chunksize=chunksize, progress=progress, pool=pool, errors=errors)
 
-    data[new_col] = data[column].apply(lambda x: rtf_to_text(x, errors=error))
+    if errors:
+        rows = np.fromiter(errors, dtype=np.int64, count=len(errors))
+        pool.add_quarantine("rft2text", data.index[rows], data[column].iloc[rows], list(errors.values()))
 
     return data
 
+def rft2text_file(input_path: str, output_path: str, column, chunksize: int = 100000, columns: list = None,
+                  drop_source: bool = False, isnull: bool = False, suffix: str = None, prefix: str = None,
+                  error: str = "strict", unique: bool = False, n_jobs: int = 1, progress: bool = False, **kwargs) -> int:
+
+    """
+    Streaming version of rft2text for files larger than memory.
+    It reads a CSV or Parquet file in chunks, converts the rich text column of each chunk with rft2text
+    and appends the result to the output file, so the memory is bounded by the chunk size.
+    The file format is selected from the file extension (.csv or .parquet), input and output formats can differ.
+    The Parquet output has the types of all chunks, a column is widened when a later chunk needs it
+    (e.g. integers that get missing values or a text column that is empty in the first chunks).
+
+    Note: it uses the striprtf library, and the pyarrow library for Parquet files.
+
+    :param input_path: path of the CSV or Parquet file to read
+    :param output_path: path of the CSV or Parquet file to write, it is overwritten if it exists
+    :param column: column name to apply as string
+    :param chunksize: number of rows read and converted at a time
+    :param columns: columns to read, None reads all columns. The rich text column is always read.
+    :param drop_source: if True, the rich text column is not written to the output, only the new text column
+    :param isnull: same as rft2text
+    :param suffix: same as rft2text
+    :param prefix: same as rft2text
+    :param error: same as rft2text
+    :param unique: same as rft2text, distinct values are searched in each chunk
+    :param n_jobs: same as rft2text
+    :param progress: if True, prints the number of rows written after each chunk
+    :param kwargs: other parameters of pd.read_csv such as encoding or sep
+    :return: number of rows written
+
+    Test and Example:
+
+    rft2text_file("notes.csv", "notes_text.parquet", "NOTE", chunksize=50000, drop_source=True, isnull=True)
+    """
+
+    if columns is not None and column not in columns:
+        columns = list(columns) + [column]
+
+    if str(input_path).endswith(".parquet"):
+        import pyarrow.parquet as pq
+        # pip install pyarrow
+
+        batches = pq.ParquetFile(input_path).iter_batches(batch_size=chunksize, columns=columns)
+        chunks = (batch.to_pandas() for batch in batches)
+    else:
+        chunks = pd.read_csv(input_path, chunksize=chunksize, usecols=columns, **kwargs)
+
+    import os
+
+    # The output is written to a temporary file and renamed at the end, a failed run leaves no partial output
+    to_parquet = str(output_path).endswith(".parquet")
+    temporary = f"{output_path}.tmp"
+    writer = None
+    schema = None
+    empty = set()
+    rows = 0
+
+    try:
+        for chunk in chunks:
+            chunk = rft2text(chunk, column, inplace=True, isnull=isnull, suffix=suffix, prefix=prefix, error=error,
+                             unique=unique, n_jobs=n_jobs)
+
+            if drop_source:
+                chunk = chunk.drop(columns=column)
+
+            if to_parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+                # The types of a chunk are inferred from its values, a column without values in the chunks read so far
+                # (e.g. NaN as float) takes the type of the first chunk with values, the others are widened
+                if schema is None:
+                    schema = table.schema
+                    empty = {i.name for i, j in zip(table.schema, table.columns) if j.null_count == len(j)}
+                else:
+                    types = []
+                    for i, j, values in zip(schema, table.schema, table.columns):
+                        if values.null_count == len(values):
+                            types.append(i.type)
+                        elif i.name in empty:
+                            types.append(j.type)
+                            empty.discard(i.name)
+                        else:
+                            types.append(_promote_type(i.type, j.type, i.name))
+                    schema = pa.schema([i.with_type(k) for i, k in zip(schema, types)], metadata=schema.metadata)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(temporary, schema)
+                elif not schema.equals(writer.schema):
+                    # The chunks written with the narrower types are copied to a new file with the widened schema
+                    writer.close()
+                    os.replace(temporary, f"{temporary}.old")
+                    written = pq.ParquetFile(f"{temporary}.old")
+                    writer = pq.ParquetWriter(temporary, schema)
+                    for k in range(written.num_row_groups):
+                        writer.write_table(written.read_row_group(k).cast(schema))
+                    written.close()
+                    os.remove(f"{temporary}.old")
+
+                writer.write_table(table.cast(schema))
+            else:
+                chunk.to_csv(temporary, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+
+            rows += len(chunk)
+
+            if progress:
+                print(f"{rows} rows written to {output_path}")
+
+        if writer is not None:
+            writer.close()
+            writer = None
+        if os.path.exists(temporary):
+            os.replace(temporary, output_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        for path in (temporary, f"{temporary}.old"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return rows
+
 ########################################################################################################################
 ########################################################################################################################
 # Binary Categorical Variable From Text
 ########################################################################################################################
 ########################################################################################################################
 
-def text2bincat(data, column, yes: str or list, no: str or list, inplace: bool = False, binary: bool = False, new_col: None = None, suffix: None = None, prefix: None = None):
+def _keyword_matcher(keywords: list, groups: list, n_groups: int, regex: bool = False) -> tuple:
+
+    """
+    Compiles lowercase keywords into one pattern that finds every keyword of a text in one pass, overlapping ones too.
+    The pattern is a lookahead, so it matches (with zero width) at each position where a keyword starts.
+
+    Plain keywords are merged into a trie, so common prefixes are matched once. Every keyword end is an empty
+    group, the last group of a match is the longest keyword at that position, and the shorter keywords
+    at that position are its prefixes, so the groups of a match are known from its lastindex.
+    Regex keywords are only joined with |, and every keyword is matched again at the positions found.
+
+    :param keywords: keywords as list of strings
+    :param groups: group number of each keyword, e.g. the flag and the "yes" or "no" side of text2bincat_batch
+    :param n_groups: number of groups
+    :param regex: if True, the keywords are regex patterns
+    :return: (compiled pattern, groups of each lastindex as boolean array of shape (groups + 1, n_groups)
+             or, with regex, list of (compiled keyword, group), groups of the empty keyword that is in every text)
+    """
+
+    always = sorted({g for word, g in zip(keywords, groups) if word == ""})
+
+    if regex:
+        pattern = "|".join(f"(?:{word})" for word in keywords if word != "")
+        checks = [(re.compile(word), g) for word, g in zip(keywords, groups) if word != ""]
+        return re.compile(f"(?=(?:{pattern}))" if checks else "(?!)"), checks, always
+
+    trie = {}
+    for word, g in zip(keywords, groups):
+        if word == "":
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node.setdefault("", set()).add(g)
+
+    ends = [set()]
+
+    def serialize(node, above: set):
+        parts = []
+        if "" in node:
+            # The groups of this keyword and of the shorter keywords on the same path
+            above = above | node[""]
+            ends.append(above)
+            parts.append("()")
+        alternatives = [re.escape(char) + serialize(child, above) for char, child in sorted(node.items()) if char != ""]
+        if alternatives:
+            children = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+            # After a keyword end, the longer keywords are optional
+            parts.append(f"(?:{children})?" if "" in node else children)
+        return "".join(parts)
+
+    # No keyword matches nothing
+    pattern = re.compile(f"(?={serialize(trie, set())})") if trie else re.compile("(?!)")
+
+    matrix = np.zeros((len(ends), n_groups), dtype=bool)
+    for index, end in enumerate(ends):
+        matrix[index, list(end)] = True
+
+    return pattern, matrix, always
+
+# Rows searched together, joined with a character that no plain keyword contains
+_KEYWORD_CHUNK = 100000
+_KEYWORD_SEPARATOR = "\x00"
+
+def _keyword_groups(lower, keywords: list, groups: list, n_groups: int, regex: bool = False) -> np.ndarray:
+
+    """
+    Searches all keywords in a lowercased text column in one pass (see _keyword_matcher)
+    and returns which groups of keywords each row contains, as str.contains of each group would.
+
+    :param lower: lowercased text column as series
+    :param keywords: lowercase keywords as list of strings
+    :param groups: group number of each keyword, from 0 to n_groups - 1
+    :param n_groups: number of groups
+    :param regex: if True, the keywords are regex patterns
+    :return: boolean numpy array of shape (rows, n_groups)
+    """
+
+    pattern, ends, always = _keyword_matcher(keywords, groups, n_groups, regex=regex)
+
+    found = np.zeros((len(lower), n_groups), dtype=bool)
+    texts = lower.to_numpy(dtype=object)
+    is_text = np.fromiter((isinstance(text, str) for text in texts), dtype=bool, count=len(texts))
+    if always:
+        found[np.ix_(is_text, always)] = True
+
+    text_rows = np.flatnonzero(is_text)
+    finditer = pattern.finditer
+
+    if regex or any(_KEYWORD_SEPARATOR in word for word in keywords):
+        # A regex can match across the separator, the rows are searched one by one
+        for k in text_rows:
+            text = texts[k]
+            if regex:
+                starts = {m.start() for m in finditer(text)}
+                row_groups = [g for keyword, g in ends if any(keyword.match(text, start) for start in starts)]
+            else:
+                row_groups = np.flatnonzero(ends[[m.lastindex for m in finditer(text)]].any(axis=0))
+            found[k, row_groups] = True
+        return found
+
+    # The groups of every keyword end as one flat list
+    group_rows, group_list = np.nonzero(ends)
+    group_counts = np.bincount(group_rows, minlength=len(ends))
+    group_starts = np.cumsum(group_counts) - group_counts
+
+    for start in range(0, len(text_rows), _KEYWORD_CHUNK):
+        rows = text_rows[start:start + _KEYWORD_CHUNK]
+        part = texts[rows]
+
+        lengths = np.fromiter(map(len, part), dtype=np.int64, count=len(part)) + 1
+        offsets = np.cumsum(lengths) - lengths
+
+        # Start and lastindex of every match, as one flat list
+        matches = np.array([i for m in finditer(_KEYWORD_SEPARATOR.join(part)) for i in (m.start(), m.lastindex)],
+                           dtype=np.int64)
+        if not len(matches):
+            continue
+        positions, marks = matches[0::2], matches[1::2]
+
+        # Row of every match, then the groups of every distinct (row, keyword end)
+        match_rows = rows[np.searchsorted(offsets, positions, side="right") - 1]
+        pairs = np.unique(match_rows * len(group_starts) + marks)
+        match_rows, marks = np.divmod(pairs, len(group_starts))
+
+        counts = group_counts[marks]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        found[np.repeat(match_rows, counts), group_list[np.repeat(group_starts[marks], counts) + within]] = True
+
+    return found
+
+def _check_conflict(conflict: str):
+
+    if conflict not in ("no", "yes", "nan", "raise"):
+        raise ValueError("conflict parameter must be one of 'no', 'yes', 'nan' or 'raise'")
+
+def _yes_no(yes: str or list, no: str or list) -> tuple:
+
+    if isinstance(yes, str) and isinstance(no, str):
+        return [yes.lower()], [no.lower()]
+    elif not (isinstance(yes, list) and isinstance(no, list)):
+        raise ValueError("yes and no parameter both are must be string or list")
+
+    return [i.lower() for i in yes], [i.lower() for i in no]
+
+def _resolve_conflict(yes_mask: np.ndarray, no_mask: np.ndarray, conflict: str = "no") -> tuple:
+
+    """
+    Resolves the rows matching both "yes" and "no" keywords as conflict of text2bincat says.
+
+    :return: yes mask and no mask, a row is never True in both
+    """
+
+    both = yes_mask & no_mask
+    if both.any():
+        if conflict == "raise":
+            raise ValueError(f"{both.sum()} rows match both yes and no keywords")
+        elif conflict == "yes":
+            no_mask &= ~both
+        elif conflict == "nan":
+            yes_mask &= ~both
+            no_mask &= ~both
+        else:
+            yes_mask &= ~both
+
+    return yes_mask, no_mask
+
+def _bincat_masks(lower, yes: str or list, no: str or list, conflict: str = "no", regex: bool = False):
+
+    """
+    Searches the "yes" and "no" keywords in a lowercased text column in one pass and resolves the rows matching both.
+
+    :param lower: lowercased text column as series
+    :param yes: keyword or list of keywords for "Yes"
+    :param no: keyword or list of keywords for "No"
+    :param conflict: same as text2bincat
+    :param regex: same as text2bincat
+    :return: yes mask and no mask as boolean numpy arrays, a row is never True in both
+    """
+
+    yes, no = _yes_no(yes, no)
+
+    found = _keyword_groups(lower, yes + no, [0] * len(yes) + [1] * len(no), 2, regex=regex)
+
+    return _resolve_conflict(found[:, 0].copy(), found[:, 1].copy(), conflict)
+
+def _bincat_result(yes_mask, no_mask, output: str = "text"):
+
+    """
+    Builds a flag column from the masks of _bincat_masks, rows matching neither are missing.
+
+    :param output: "text" gives "Yes" / "No" / NaN as object, "boolean" True / False / <NA>,
+                   "int8" 1 / 0 / <NA> and "category" "Yes" / "No" / NaN as category
+    :return: numpy array or pandas extension array
+    """
+
+    if output == "text":
+        result = np.full(len(yes_mask), np.nan, dtype=object)
+        result[yes_mask] = "Yes"
+        result[no_mask] = "No"
+    elif output == "category":
+        codes = np.full(len(yes_mask), -1, dtype=np.int8)
+        codes[no_mask] = 0
+        codes[yes_mask] = 1
+        result = pd.Categorical.from_codes(codes, categories=["No", "Yes"])
+    else:
+        values = yes_mask if output == "boolean" else yes_mask.astype(np.int8)
+        result = pd.array(values, dtype="boolean" if output == "boolean" else "Int8")
+        result[~(yes_mask | no_mask)] = pd.NA
+
+    return result
+
+def text2bincat(data, column, yes: str or list, no: str or list, inplace: bool = False, binary: bool = False, new_col: None = None, suffix: None = None, prefix: None = None,
+                conflict: str = "no", regex: bool = False, compact: bool = False):
 
     """
     The text2bincat function is used to search a text for the presence of certain keywords,
@@ -208,27 +809,42 @@ def text2bincat(data, column, yes: str or list, no: str or list, inplace: bool =
     a string or list of strings to match for "yes" values, a string or list of strings to match for "no" values,
     and several optional parameters for handling the new column name, whether to modify the dataframe in place,
     and whether to output binary values. The function creates a new column in the dataframe,
-    and then uses the str.contains method to find instances of the specified "yes" and "no" strings in the specified column,
+    and then searches the specified "yes" and "no" strings in the specified column,
     and assigns "Yes" or "No" to the new column accordingly.
     The output can also be set to return a binary value of True or False, if the binary parameter is set to True.
 
-    :param data:
-    :param column:
-    :param yes:
-    :param no:
-    :param inplace:
-    :param binary:
-    :param new_col:
-    :param suffix:
-    :param prefix:
-    :return:
+    The keywords are compiled once into a trie shaped pattern (see _keyword_matcher),
+    and the "yes" and "no" keywords are found in one pass over the lowercased column.
+
+    :param data: dataframe as pandas dataframe
+    :param column: text column name as string
+    :param yes: keyword or list of keywords for "Yes", the search is case insensitive
+    :param no: keyword or list of keywords for "No", the search is case insensitive
+    :param inplace: same as other libraries
+    :param binary: if True, the new column is True / False instead of "Yes" / "No"
+    :param new_col: new column name as string
+    :param suffix: add suffix to column name for the new column name as string
+    :param prefix: add prefix to column name for the new column name as string
+    :param conflict: what to assign when a row matches both "yes" and "no" keywords.
+                     "no" (default) assigns "No", "yes" assigns "Yes", "nan" leaves the row empty
+                     and "raise" raises ValueError.
+    :param regex: if True, the keywords are used as regex patterns instead of plain text
+    :param compact: if True, the new column is category ("Yes" / "No"), or boolean (True / False / <NA>)
+                    with binary, instead of object. They take 1 byte per row instead of a Python object.
+    :return: data as dataframe
 
 
     Test and Exmaple:
 
+    data = pd.DataFrame({"NOTE": ["Patient smokes", "Non smoker", "Ex-smoker, does not smoke now", None]})
 
+    text2bincat(data, "NOTE", yes=["smokes", "smoker"], no=["non smoker", "not smoke"], new_col="SMOKING")
+
+    text2bincat(data, "NOTE", yes=["smokes", "smoker"], no=["non smoker", "not smoke"], new_col="SMOKING", conflict="nan")
 
     """
+    _check_conflict(conflict)
+
     # Create a copy of the dataframe if inplace is not set
     if not inplace:
         data = data.copy()
@@ -242,238 +858,2026 @@ def text2bincat(data, column, yes: str or list, no: str or list, inplace: bool =
     else:
         new_col = text2bincat.__name__ + "_"
 
-    data[new_col] = np.nan
+    yes_mask, no_mask = _bincat_masks(data[column].str.lower(), yes, no, conflict=conflict, regex=regex)
 
-    if isinstance(yes, str) and isinstance(no, str):
+    if compact:
+        data[new_col] = _bincat_result(yes_mask, no_mask, "boolean" if binary else "category")
+        return data
 
-        yes = yes.lower()
-        no = no.lower()
+    data[new_col] = _bincat_result(yes_mask, no_mask)
 
-        data.loc[data[column].str.lower().str.contains(yes, na=False), new_col] = "Yes"
-        data.loc[data[column].str.lower().str.contains(no, na=False), new_col] = "No"
+    if binary:
+        data[new_col] = data[new_col].map({"Yes": True, "No": False})
 
-    elif isinstance(yes, list) and isinstance(no, list):
+    return data
 
-        yes = [i.lower() for i in yes]
-        no = [i.lower() for i in no]
+def text2bincat_batch(data, column, labels: dict, inplace: bool = False, output: str = "boolean", conflict: str = "no", regex: bool = False):
 
-        data.loc[data[column].str.lower().str.contains('|'.join(yes), na=False), new_col] = "Yes"
-        data.loc[data[column].str.lower().str.contains('|'.join(no), na=False), new_col] = "No"
+    """
+    Batch version of text2bincat for many flags on the same text column.
+    The column is lowercased once, and one pass with the keywords of all flags (see _keyword_groups) finds
+    the "yes" and "no" keywords of every flag in every row. All flags are added to the dataframe in one assignment
+    (one by one with inplace).
 
-    else:
-        raise ValueError("yes and no parameter both are must be string or list")
+    :param data: dataframe as pandas dataframe
+    :param column: text column name as string
+    :param labels: new column names and their keywords as dict, {new_col: (yes, no)}.
+                   yes and no are keyword or list of keywords as in text2bincat.
+    :param inplace: same as other libraries
+    :param output: dtype of the new columns. "boolean" gives True / False / <NA> (pandas boolean),
+                   "int8" gives 1 / 0 / <NA> (pandas Int8), "text" gives "Yes" / "No" / NaN as text2bincat
+                   and "category" gives "Yes" / "No" / NaN as category.
+    :param conflict: same as text2bincat
+    :param regex: same as text2bincat
+    :return: data as dataframe
 
-    if binary:
-        data[new_col] = data[new_col].map({"Yes": True, "No": False})
+    Test and Example:
 
-    return data
+    data = pd.DataFrame({"NOTE": ["Patient smokes, no fever", "Non smoker, has fever", None]})
+
+    text2bincat_batch(data, "NOTE", {"SMOKING": (["smokes", "smoker"], ["non smoker"]),
+                                     "FEVER": (["fever"], ["no fever"])}, conflict="no")
+    """
+
+    if output not in ("boolean", "int8", "text", "category"):
+        raise ValueError("output parameter must be one of 'boolean', 'int8', 'text' or 'category'")
+    _check_conflict(conflict)
+
+    if not inplace:
+        data = data.copy()
+
+    lower = data[column].str.lower()
+
+    # Every keyword of every flag is in one pattern, group 2 * k is the "yes" side of flag k and 2 * k + 1 its "no" side
+    keywords = []
+    groups = []
+    for k, (yes, no) in enumerate(labels.values()):
+        yes, no = _yes_no(yes, no)
+        keywords += yes + no
+        groups += [2 * k] * len(yes) + [2 * k + 1] * len(no)
+
+    found = _keyword_groups(lower, keywords, groups, 2 * len(labels), regex=regex)
+
+    new_data = {}
+    for k, new_col in enumerate(labels):
+        yes_mask, no_mask = _resolve_conflict(found[:, 2 * k].copy(), found[:, 2 * k + 1].copy(), conflict)
+
+        new_data[new_col] = _bincat_result(yes_mask, no_mask, output)
+
+    return _assign_columns(data, pd.DataFrame(new_data, index=data.index), inplace)
 
 ########################################################################################################################
 ########################################################################################################################
-# Multi Categorical Variable From Text
+# Tokens
 ########################################################################################################################
 ########################################################################################################################
 
-def text2multicat(data,column,keyword,extra_stopwords: list = None, inplace: bool = False,threshold: int = 1, stopwords_lang:str = "turkish"):
+# Tokens are words joined by . , or ' (e.g. 1,881 or 3.5) and single punctuation marks
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.,']\w+)*|[^\w\s]")
 
-    import string
+# Same tokens as a group, split gives the text between them too
+_SPLIT_TOKEN_PATTERN = re.compile(f"({_TOKEN_PATTERN.pattern})")
 
-    import nltk
-    # pip install nltk
+def _nltk_spans(text: str) -> list:
 
-    from collections import Counter
-    # pip install collection
-
-    nltk.download('stopwords')
+    """
+    Tokens of nltk word_tokenize with their start in text. word_tokenize changes some tokens (e.g. " to ``),
+    such a token gets the position after the previous token.
+    """
 
-    # inplace true değilse data kopyasını al
-    if not inplace:
-        data = data.copy()
+    from nltk.tokenize import word_tokenize
+    # pip install nltk
 
-    # verilen keyword'ü texten çıkar ve her bir satıra keyword'ün olduğu cümleyi yeni bir kolonda ata.
-    # not: keyword'ün bitişi nokta olarak seçildi. Parametre olarak eklenecek.
-    # https://pandas.pydata.org/docs/reference/api/pandas.Series.str.extract.html
-    data[keyword] = data[column].str.extract(f'({keyword}.*?)[.]', expand=False)
+    spans = []
+    position = 0
+    for token in word_tokenize(text):
+        start = text.find(token, position)
+        if start == -1:
+            start = position
+        spans.append((token, start))
+        position = start + len(token)
 
-    # yeni kolondaki boş değerleri doldur. Splitte hata veriyor nan değerler.
-    data[keyword].fillna("", inplace=True)
+    return spans
 
-    # keyword'ün geçtiği cümledeki en çok tekrar eden kelimleri bulmak için cümleyi kelimelere böl.
-    split_strings = data[keyword].str.split(" ")
+class TokenStore:
 
-    # en sık tekrar eden kelimeleri bul.
-    # not: collection kütüphanesi kullanıldı.
-    result = [word[0] for word in Counter([word for sublist in split_strings for word in sublist]).most_common() if word[0] not in keyword]
+    """
+    Tokens of a text column, tokenized once and shared by the text functions of this module
+    (extract_numbers_from_text, text2multicat, Text2MultiCat). Instead of a Python list per row, the tokens are kept
+    as codes of a vocabulary of distinct tokens and the offsets of the rows, with the start of every token in its text.
 
-    # sık tekrar eden kelimelerden stop word'leri çıkarmak için stopwords leri tanımla.
-    # extra_stopwords parametresi ile genişletilebilir.
-    # araya print ekledim çıkan sonuçta frekansı sık olan kelimeler görünecek büyük ihtimalle gürültü bir kelime illa çıkacaktır.
-    # extra_stopwords parametresine ekleyip tekrar çalıştırın.
-    stopwords = nltk.corpus.stopwords.words(stopwords_lang) + extra_stopwords if extra_stopwords else nltk.corpus.stopwords.words(stopwords_lang)
+    :param values: text column as pandas series, missing values have no tokens
+    :param tokenizer: "regex" splits the text with a regular expression, "nltk" uses nltk word_tokenize.
+                      regex is much faster, nltk splits some punctuation and contractions differently.
 
-    # stopwords leri çıkarma
-    result = nltk.word_tokenize(' '.join(result))
-    result = [word for word in result if word.lower() not in stopwords]
+    Test and Example:
 
-    # noktalama işaretlerini çıkarma
-    result = [word for word in result if word not in string.punctuation]
+    tokens = TokenStore(data["NOTE"])
 
-    # gürültü kelime varsa görmek için print
-    print(result)
+    extract_numbers_from_text(data, "NOTE", tokens=tokens)
 
-    # bir tane threshold varsa en sık tekrar eden kelimeyi cümlenin geçtiği satıra değer olarak atar.
-    if threshold == 1:
-        data[keyword].loc[list(data[data[keyword].str.contains((result[0]), na=False)].index)] = result[0]
+    text2multicat(data, "NOTE", "Tanı", tokens=tokens)
 
-    # birden fazla threshold varsa girilen değer kadar en yüksek frekanslı tekrar eden kelimeleri
-    # cümlenin geçtiği satıra değer olarak atar.
-    elif threshold > 1:
-        for i in result[:threshold]:
-            print(i)
-            data[keyword].loc[list(data[data[keyword].str.contains((i), na=False)].index)] = i
+    tokens[0], tokens.nbytes
+    """
 
-    # dataframe olarak döndürür
-    return data
+    def __init__(self, values: pd.Series, tokenizer: str = "regex"):
+
+        texts = [text if isinstance(text, str) else "" for text in values]
+
+        if tokenizer == "regex":
+            # One split of the rows joined by new lines, a token never contains a new line.
+            # The split gives the whitespace between the tokens too, their lengths give the token starts
+            # without a match object per token.
+            parts = _SPLIT_TOKEN_PATTERN.split("\n".join(texts))
+            flat = parts[1::2]
+            part_lengths = np.fromiter(map(len, parts), dtype=np.int64, count=len(parts))
+            starts = (np.cumsum(part_lengths) - part_lengths)[1::2]
+
+            row_begins = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]]) if texts else np.zeros(0, dtype=np.int64)
+            offsets = np.searchsorted(starts, row_begins)
+            lengths = np.diff(np.append(offsets, len(flat)))
+            starts = starts - np.repeat(row_begins, lengths)
+        elif tokenizer == "nltk":
+            flat = []
+            starts = []
+            lengths = np.zeros(len(texts), dtype=np.int64)
+            for i, text in enumerate(texts):
+                row = _nltk_spans(text)
+                lengths[i] = len(row)
+                flat += [token for token, _ in row]
+                starts += [start for _, start in row]
+        else:
+            raise ValueError("tokenizer parameter must be 'regex' or 'nltk'")
 
-########################################################################################################################
-########################################################################################################################
-# Extract numbers from text column
-########################################################################################################################
-########################################################################################################################
+        codes, vocabulary = pd.factorize(np.array(flat, dtype=object))
 
-def extract_numbers_from_text(data: pd.DataFrame, column: str, col_range: int = 3, inplace: bool = False):
+        self.tokenizer = tokenizer
+        self.index = values.index
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.codes = codes.astype(np.int32)
+        self.starts = np.array(starts, dtype=np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
 
-    """
+    def __len__(self) -> int:
 
-    It finds the float values in a column containing string values, creates a new column with the words before it,
-    and assigns the float values to these new columns according to their indexes.
+        return len(self.offsets) - 1
 
-    :param data: data as pandas dataframe
-    :param column: column name to implement
-    :param col_range: Determines how many words to take before the numeric value. Note: assigned as column name
-    :param inplace: same as others
-    :return: data as pandas dataframe
+    def __getitem__(self, position: int) -> list:
 
-    Test and example:
+        return list(self.vocabulary[self.codes[self.offsets[position]:self.offsets[position + 1]]])
 
-    test_data = pd.DataFrame({           "id" : ["1","1","2","2","3"],
-                              "string_column" : ["Ne mutlu 'Türküm' diyene! - Mustafa Kemal Atatürk 1881",
-                                             "İstikbal göklerdedir! - Mustafa Kemal Atatürk 1938",
-                                             "Onlar korkularından denizi zincirleyecek kadar akıllı ise, biz gemileri karadan yürütebilecek kadar deliyiz! - Fatih Sultan Mehmet 1453",
-                                             "Size öyle bir vatan aldım ki; ebediyen sizin olacaktır! - Başbuğ Alp Arslan 1071",
-                                             "Ne kadar verimsiz olursa olsun toprak devletin temelidir; hiç kimseye verilemez! - Büyük Mete Han 234"
-                                             ]})
+    @property
+    def nbytes(self) -> int:
 
-    extract_numbers_from_text(test_data, "string_column")
+        """
+        Memory of the codes, starts and offsets arrays. The vocabulary holds every distinct token once.
+        """
 
-    """
+        return self.codes.nbytes + self.starts.nbytes + self.offsets.nbytes
 
-    if not inplace:
-        data = data.copy()
+    def lengths(self) -> np.ndarray:
 
-    from nltk.tokenize import word_tokenize
+        return np.diff(self.offsets)
 
-    for i, j in enumerate(data[column]):
+    def rows(self) -> np.ndarray:
 
-        tokens = word_tokenize(j)
+        """
+        Position of the row of every token.
+        """
 
-        for index, token in enumerate(tokens):
+        return np.repeat(np.arange(len(self)), self.lengths())
 
-            if token.replace(",", "").isdecimal():
+    def take(self, positions) -> "TokenStore":
 
-                col_name = " ".join(tokens[max(0, index - col_range): index]).strip()
+        """
+        Returns the tokens of the rows at positions, sharing the vocabulary.
+        """
 
-                if any(c.isdecimal() for c in col_name):
-                    continue
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = self.lengths()[positions]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        tokens = np.repeat(self.offsets[positions] - offsets[:-1], lengths) + np.arange(offsets[-1])
 
-                data.loc[i, col_name] = token
+        store = TokenStore.__new__(TokenStore)
+        store.tokenizer = self.tokenizer
+        store.index = self.index[positions]
+        store.vocabulary = self.vocabulary
+        store.codes = self.codes[tokens]
+        store.starts = self.starts[tokens]
+        store.offsets = offsets
 
-    return data
+        return store
 
-if __name__ == "main":
+    def check(self, values: pd.Series):
 
-    test_data = pd.DataFrame({"id": ["1", "1", "2", "2", "3"],
-                              "string_column": ["Ne mutlu 'Türküm' diyene! - Mustafa Kemal Atatürk 1881",
-                                                "İstikbal göklerdedir! - Mustafa Kemal Atatürk 1938",
-                                                "Onlar korkularından denizi zincirleyecek kadar akıllı ise, biz gemileri karadan yürütebilecek kadar deliyiz! - Fatih Sultan Mehmet 1453",
-                                                "Size öyle bir vatan aldım ki; ebediyen sizin olacaktır! - Başbuğ Alp Arslan 1071",
-                                                "Ne kadar verimsiz olursa olsun toprak devletin temelidir; hiç kimseye verilemez! - Büyük Mete Han 234"
-                                                ]})
+        """
+        Raises ValueError if the tokens are not of values, compared by length and index.
+        """
 
-    extract_numbers_from_text(test_data, "string_column")
+        if len(values) != len(self) or not values.index.equals(self.index):
+            raise ValueError("tokens are not of this column, create the TokenStore from the same rows")
 
 ########################################################################################################################
 ########################################################################################################################
-# Asynchronous programming
+# Multi Categorical Variable From Text
 ########################################################################################################################
 ########################################################################################################################
 
-if __name__ == "main":
+@lru_cache(maxsize=None)
+def _stopwords(lang: str) -> frozenset:
 
-    print(__name__)
+    """
+    Returns the NLTK stopwords of a language. The corpus is downloaded only when it is not found,
+    and the result is cached for the next calls.
+    """
 
-    import threading as th
-    import time
+    import nltk
+    # pip install nltk
 
-    data1 = {"A": [1, 2, 1],
-                 "B": ["Z", "X", "Z"],
-                 "C": ["A", "S", "D"]}
+    try:
+        words = nltk.corpus.stopwords.words(lang)
+    except LookupError:
+        nltk.download('stopwords')
+        words = nltk.corpus.stopwords.words(lang)
 
-    data1 = pd.DataFrame(data1)
+    return frozenset(words)
 
-    data2 = {"ID": [1, 1, 2, 2, 3, 4, 5],
-            "TEST": ["1.45", "2.45", "47", "12.12.00", "123.00.00", "23.45", "215.00"]}
+class Text2MultiCat:
 
-    data2 = pd.DataFrame(data2)
+    """
+    Fit / transform version of text2multicat.
+    fit computes the most frequent words of the sentences starting with the keyword and keeps them as vocabulary,
+    transform assigns those words to the sentences of any data without recomputing the corpus statistics.
 
-    def sum(a,b):
-        print("Start")
-        time.sleep(5)
-        print(a+b)
+    :param keyword: keyword to search as string, the sentence starting with it until a period is extracted
+    :param extra_stopwords: words to remove besides the NLTK stopwords as list
+    :param threshold: number of most frequent words to assign
+    :param stopwords_lang: language of the NLTK stopwords as string
 
-    def end ():
-        print("End")
+    Test and Example:
 
+    model = Text2MultiCat("Tanı", extra_stopwords=["hasta"], threshold=3).fit(data, "NOTE")
 
-    th.Thread(target=cat_to_var, args=(data1, "B", "C")).start()
-    th.Thread(target=del_repeated_last_occur_str, args=(data2, ".", "TEST")).start()
+    model.vocabulary_
 
-    th.Thread(target=sum, args=(10,10)).start()
-    th.Thread(target=end, args=()).start()
+    new_data = model.transform(new_data, "NOTE")
+    """
 
+    def __init__(self, keyword: str, extra_stopwords: list = None, threshold: int = 1, stopwords_lang: str = "turkish"):
 
-########################################################################################################################
-########################################################################################################################
-# Parallel Programming
-########################################################################################################################
-########################################################################################################################
+        self.keyword = keyword
+        self.extra_stopwords = extra_stopwords
+        self.threshold = threshold
+        self.stopwords_lang = stopwords_lang
 
-if __name__ == "main":
+        # verilen keyword'ü texten çıkar, keyword'ün bitişi nokta olarak seçildi.
+        # https://pandas.pydata.org/docs/reference/api/pandas.Series.str.extract.html
+        self._pattern = re.compile(f'({keyword}.*?)[.]')
 
-    from joblib import Parallel, delayed
+    def _sentences(self, data, column):
 
-########################################################################################################################
-########################################################################################################################
-# multiprocessing
-########################################################################################################################
-########################################################################################################################
+        # yeni kolondaki boş değerleri doldur. Splitte hata veriyor nan değerler.
+        return data[column].str.extract(self._pattern, expand=False).fillna("")
 
-########################################################################################################################
-########################################################################################################################
-# Subprocess
-########################################################################################################################
-########################################################################################################################
+    def _token_words(self, values, tokens: TokenStore) -> list:
 
+        """
+        Words of the sentences with the keyword in frequency order, counted on the tokens of a TokenStore.
+        Words with the same count are in the order they are first found, as Counter.most_common.
+        """
 
-########################################################################################################################
-########################################################################################################################
-# Decorators
-########################################################################################################################
-########################################################################################################################
+        # Start and end of the sentence of every row, -1 when the keyword is not found
+        spans = np.array([match.span(1) if match else (-1, -1)
+                          for match in (self._pattern.search(text) if isinstance(text, str) else None for text in values)],
+                         dtype=np.int64).reshape(-1, 2)
+
+        rows = tokens.rows()
+        ends = tokens.starts + np.fromiter(map(len, tokens.vocabulary), dtype=np.int64, count=len(tokens.vocabulary))[tokens.codes]
+        inside = (tokens.starts >= spans[rows, 0]) & (ends <= spans[rows, 1])
+
+        codes = tokens.codes[inside]
+        counts = np.bincount(codes, minlength=len(tokens.vocabulary))
+        found, first = np.unique(codes, return_index=True)
+
+        return list(tokens.vocabulary[found[np.lexsort((first, -counts[found]))]])
+
+    def fit(self, data, column, tokens: TokenStore = None):
+
+        """
+        Computes the word frequencies of the sentences with the keyword and keeps the most frequent words.
 
+        :param data: dataframe as pandas dataframe
+        :param column: text column name as string
+        :param tokens: TokenStore of the column. The words are counted on its tokens instead of splitting
+                       the sentences on spaces and tokenizing the words with NLTK again, so a word followed by
+                       a punctuation mark is counted with the same word without it.
+        :return: self, words_ has all words in frequency order and vocabulary_ the words to assign
+        """
 
+        import string
+
+        if tokens is not None:
+            tokens.check(data[column])
+
+            stopwords = _stopwords(self.stopwords_lang) | set(self.extra_stopwords or [])
+            result = [word for word in self._token_words(data[column], tokens) if word not in self.keyword]
+            result = [word for word in result if word.lower() not in stopwords and word not in string.punctuation]
+
+            self.words_ = result
+            self.vocabulary_ = result[:self.threshold] if self.threshold >= 1 else []
+
+            return self
+
+        import nltk
+        # pip install nltk
+
+        from collections import Counter
+
+        # keyword'ün geçtiği cümledeki en çok tekrar eden kelimleri bulmak için cümleyi kelimelere böl.
+        split_strings = self._sentences(data, column).str.split(" ")
+
+        # en sık tekrar eden kelimeleri bul.
+        result = [word[0] for word in Counter([word for sublist in split_strings for word in sublist]).most_common() if word[0] not in self.keyword]
+
+        # sık tekrar eden kelimelerden stop word'leri çıkarmak için stopwords leri tanımla.
+        # extra_stopwords parametresi ile genişletilebilir.
+        stopwords = _stopwords(self.stopwords_lang) | set(self.extra_stopwords or [])
+
+        # stopwords leri ve noktalama işaretlerini çıkarma
+        result = nltk.word_tokenize(' '.join(result))
+        result = [word for word in result if word.lower() not in stopwords and word not in string.punctuation]
+
+        self.words_ = result
+        self.vocabulary_ = result[:self.threshold] if self.threshold >= 1 else []
+
+        return self
+
+    def transform(self, data, column, inplace: bool = False, compact: bool = False):
+
+        """
+        Creates a column named as the keyword with the sentence starting with the keyword.
+        If the sentence contains a word of the vocabulary, the word is assigned instead of the sentence.
+        When several words are found, the most frequent one is assigned.
+
+        :param data: dataframe as pandas dataframe
+        :param column: text column name as string
+        :param inplace: same as other libraries
+        :param compact: if True, the new column is category instead of object
+        :return: data as dataframe
+        """
+
+        if not hasattr(self, "vocabulary_"):
+            raise ValueError("Text2MultiCat is not fitted yet, call fit before transform.")
+
+        if not inplace:
+            data = data.copy()
+
+        sentences = self._sentences(data, column)
+
+        words = self.vocabulary_
+        masks = [sentences.str.contains(word, regex=False).to_numpy(dtype=bool) for word in words]
+
+        # The first word found in the vocabulary order is assigned. A row with an assigned word is matched again
+        # by the next words as the column is updated word by word, so a later word inside it replaces it.
+        choices = []
+        for i, word in enumerate(words):
+            for later in words[i + 1:]:
+                if later in word:
+                    word = later
+            choices.append(word)
+
+        result = np.select(masks, choices, default=sentences.to_numpy(dtype=object)) if words else sentences
+
+        data[self.keyword] = pd.Categorical(result) if compact else result
+
+        return data
+
+    def fit_transform(self, data, column, inplace: bool = False, compact: bool = False, tokens: TokenStore = None):
+
+        return self.fit(data, column, tokens=tokens).transform(data, column, inplace=inplace, compact=compact)
+
+def text2multicat(data,column,keyword,extra_stopwords: list = None, inplace: bool = False,threshold: int = 1, stopwords_lang:str = "turkish",
+                  compact: bool = False, tokens: TokenStore = None):
+
+    """
+    It extracts the sentences starting with the keyword into a new column named as the keyword,
+    and replaces the sentences with their most frequent words (threshold many) after removing stopwords.
+    See Text2MultiCat to reuse the computed words on new data.
+
+    :param data: dataframe as pandas dataframe
+    :param column: text column name as string
+    :param keyword: keyword to search as string
+    :param extra_stopwords: words to remove besides the NLTK stopwords as list
+    :param inplace: same as other libraries
+    :param threshold: number of most frequent words to assign
+    :param stopwords_lang: language of the NLTK stopwords as string
+    :param compact: if True, the new column is category instead of object
+    :param tokens: TokenStore of the column, see Text2MultiCat.fit
+    :return: data as dataframe
+    """
+
+    model = Text2MultiCat(keyword, extra_stopwords=extra_stopwords, threshold=threshold, stopwords_lang=stopwords_lang)
+
+    model.fit(data, column, tokens=tokens)
+
+    # gürültü kelime varsa görmek için print
+    # araya print ekledim çıkan sonuçta frekansı sık olan kelimeler görünecek büyük ihtimalle gürültü bir kelime illa çıkacaktır.
+    # extra_stopwords parametresine ekleyip tekrar çalıştırın.
+    print(model.words_)
+
+    # dataframe olarak döndürür
+    return model.transform(data, column, inplace=inplace, compact=compact)
+
+########################################################################################################################
+########################################################################################################################
+# Extract numbers from text column
+########################################################################################################################
+########################################################################################################################
+
+def _number_triples(values, col_range: int = 3, tokenizer: str = "regex", tokens: TokenStore = None) -> pd.DataFrame:
+
+    """
+    Finds the numbers of a text column and the col_range tokens before them, for extract_numbers_from_text.
+
+    :return: dataframe with row (position in values), label and value columns, in the order they are found
+    """
+
+    if tokens is None:
+        tokens = TokenStore(values, tokenizer=tokenizer)
+    else:
+        tokens.check(values)
+
+    # Row position and the start of the row of every token
+    row_pos = tokens.rows()
+    row_start = tokens.offsets[row_pos]
+
+    # Numbers are found once per distinct token
+    vocabulary = tokens.vocabulary
+    numbers = pd.Series(vocabulary, dtype=object).str.replace(",", "", regex=False)
+    is_number = numbers.str.isdecimal().to_numpy(dtype=bool)
+    number_values = np.full(len(vocabulary), np.nan)
+    # float reads every decimal digit of isdecimal (e.g. Arabic-Indic or fullwidth digits), pd.to_numeric only 0-9
+    number_values[is_number] = numbers[is_number].map(float).to_numpy(dtype=float)
+
+    codes = tokens.codes
+    positions = np.flatnonzero(is_number[codes])
+
+    # The label is the col_range tokens before the number in the same row, as codes. -1 is before the row start.
+    previous = np.full((len(positions), col_range), -1, dtype=np.int32)
+    for j, k in enumerate(range(col_range, 0, -1)):
+        previous[:, j] = np.where(positions - k >= row_start[positions], codes[np.maximum(positions - k, 0)], -1)
+
+    # Labels containing a number are skipped, the -1 code indexes the last item, which has no digit
+    has_digit = np.append(pd.Series(vocabulary, dtype=object).str.contains(r"\d", regex=True).to_numpy(dtype=bool), False)
+    keep = ~has_digit[previous].any(axis=1)
+    positions = positions[keep]
+    previous = previous[keep]
+
+    # Every distinct sequence of tokens is joined to text once
+    if col_range > 0:
+        combinations, inverse = np.unique(previous, axis=0, return_inverse=True)
+        labels = np.array([" ".join(vocabulary[i] for i in combination if i >= 0) for combination in combinations],
+                          dtype=object)[inverse.reshape(-1)]
+    else:
+        labels = np.full(len(positions), "", dtype=object)
+
+    triples = pd.DataFrame({"row": row_pos[positions],
+                            "label": labels,
+                            "value": number_values[codes[positions]]})
+    triples = triples.drop_duplicates(subset=["row", "label"], keep="last")
+
+    return triples
+
+def _number_columns(data, triples: pd.DataFrame, long: bool = False, inplace: bool = False):
+
+    """
+    Builds the output of extract_numbers_from_text from the triples of _number_triples.
+    """
+
+    if long:
+        return pd.DataFrame({"label": triples["label"].to_numpy(), "value": triples["value"].to_numpy()},
+                            index=data.index[triples["row"].to_numpy()])
+
+    if not inplace:
+        data = data.copy()
+
+    codes, new_cols = pd.factorize(triples["label"])
+    rows = triples["row"].to_numpy()
+    block = np.full((len(data), len(new_cols)), np.nan)
+    block[rows, codes] = triples["value"].to_numpy()
+    new_data = pd.DataFrame(block, index=data.index, columns=new_cols)
+
+    # A label that is already a column only changes the rows where it is found
+    for k, col in enumerate(new_cols):
+        if col in data.columns:
+            found = codes == k
+            data.loc[data.index[rows[found]], col] = new_data[col].iloc[rows[found]].to_numpy()
+    new_data = new_data[[col for col in new_cols if col not in data.columns]]
+
+    return _assign_columns(data, new_data, inplace)
+
+def extract_numbers_from_text(data: pd.DataFrame, column: str, col_range: int = 3, inplace: bool = False, long: bool = False, tokenizer: str = "regex",
+                              tokens: TokenStore = None):
+
+    """
+
+    It finds the numeric values in a column containing string values, creates a new column with the words before it,
+    and assigns the numeric values to these new columns according to their indexes.
+
+    The tokens of all rows are processed as flat arrays, the (row, label, value) triples are collected
+    and all new columns are added in one assignment (one by one with inplace). Numbers are written with thousands separators removed,
+    as float. If the same label is found twice in a row, the last number is kept.
+
+    :param data: data as pandas dataframe
+    :param column: column name to implement
+    :param col_range: Determines how many words to take before the numeric value. Note: assigned as column name
+    :param inplace: same as others
+    :param long: if True, data is not changed and a long dataframe is returned instead,
+                 with the row index of data as index and "label" and "value" columns.
+                 Useful when there are many different labels.
+    :param tokenizer: "regex" splits the text with a regular expression, "nltk" uses nltk word_tokenize
+    :param tokens: TokenStore of the column, the column is not tokenized again and tokenizer is not used
+    :return: data as pandas dataframe
+
+    Test and example:
+
+    test_data = pd.DataFrame({           "id" : ["1","1","2","2","3"],
+                              "string_column" : ["Ne mutlu 'Türküm' diyene! - Mustafa Kemal Atatürk 1881",
+                                             "İstikbal göklerdedir! - Mustafa Kemal Atatürk 1938",
+                                             "Onlar korkularından denizi zincirleyecek kadar akıllı ise, biz gemileri karadan yürütebilecek kadar deliyiz! - Fatih Sultan Mehmet 1453",
+                                             "Size öyle bir vatan aldım ki; ebediyen sizin olacaktır! - Başbuğ Alp Arslan 1071",
+                                             "Ne kadar verimsiz olursa olsun toprak devletin temelidir; hiç kimseye verilemez! - Büyük Mete Han 234"
+                                             ]})
+
+    extract_numbers_from_text(test_data, "string_column")
+
+    """
+
+    triples = _number_triples(data[column], col_range=col_range, tokenizer=tokenizer, tokens=tokens)
+
+    return _number_columns(data, triples, long=long, inplace=inplace)
+
+if __name__ == "__main__":
+
+    test_data = pd.DataFrame({"id": ["1", "1", "2", "2", "3"],
+                              "string_column": ["Ne mutlu 'Türküm' diyene! - Mustafa Kemal Atatürk 1881",
+                                                "İstikbal göklerdedir! - Mustafa Kemal Atatürk 1938",
+                                                "Onlar korkularından denizi zincirleyecek kadar akıllı ise, biz gemileri karadan yürütebilecek kadar deliyiz! - Fatih Sultan Mehmet 1453",
+                                                "Size öyle bir vatan aldım ki; ebediyen sizin olacaktır! - Başbuğ Alp Arslan 1071",
+                                                "Ne kadar verimsiz olursa olsun toprak devletin temelidir; hiç kimseye verilemez! - Büyük Mete Han 234"
+                                                ]})
+
+    print(extract_numbers_from_text(test_data, "string_column"))
+
+########################################################################################################################
+########################################################################################################################
+# Pipeline
+########################################################################################################################
+########################################################################################################################
+
+# Parameters of the functions that name the columns they read
+_STEP_READS = {"cat2var": ("cat_column", "var_column"),
+               "del_repeated_last_occur_str": ("column",),
+               "rft2text": ("column",),
+               "text2bincat": ("column",),
+               "text2bincat_batch": ("column",),
+               "text2multicat": ("column",),
+               "extract_numbers_from_text": ("column",)}
+
+def _step_missing(name: str, kwargs: dict, available) -> list:
+
+    """
+    Returns the columns a step reads that are not in available.
+    """
+
+    return [kwargs[i] for i in _STEP_READS.get(name, ()) if i in kwargs and kwargs[i] not in available]
+
+def _step_writes(name: str, kwargs: dict):
+
+    """
+    Returns the columns a step creates or changes, None if they depend on the values of the data.
+    """
+
+    if name == "cat2var":
+        if kwargs.get("categories") is None:
+            return None
+        return [_new_col_name(i, kwargs.get("suffix"), kwargs.get("prefix")) for i in kwargs["categories"]]
+    elif name == "del_repeated_last_occur_str":
+        return [kwargs["column"]]
+    elif name == "rft2text":
+        return [_new_col_name(kwargs["column"], kwargs.get("suffix"), kwargs.get("prefix"), "_rft2text")]
+    elif name == "text2bincat":
+        if kwargs.get("new_col"):
+            return [kwargs["new_col"]]
+        elif kwargs.get("suffix") or kwargs.get("prefix"):
+            return [_new_col_name(kwargs["column"], kwargs.get("suffix"), kwargs.get("prefix"))]
+        return ["text2bincat_"]
+    elif name == "text2bincat_batch":
+        return list(kwargs["labels"])
+    elif name == "text2multicat":
+        return [kwargs["keyword"]]
+
+    return None
+
+class Pipeline:
+
+    """
+    Runs the functions of this module one after another on one working dataframe.
+    The input is copied at most once and every step runs on the working dataframe with inplace=True,
+    so a chain of steps does not make a copy per step. The steps that add many columns (cat2var, text2bincat_batch,
+    extract_numbers_from_text) return a new working dataframe with one pd.concat that shares the columns of the
+    previous one, instead of adding the columns one by one. The columns read by the steps are checked before running.
+
+    :param steps: list of (function, parameters) tuples. function is a function of this module or its name,
+                  parameters is a dict of its keyword parameters, without data and inplace.
+                  Other functions can be used too, they are called as function(data, **parameters)
+                  and they must return the dataframe.
+
+    Test and Example:
+
+    pipeline = Pipeline([("del_repeated_last_occur_str", {"char": ".", "column": "RESULT"}),
+                         ("cat2var", {"cat_column": "TEST", "var_column": "RESULT"}),
+                         ("rft2text", {"column": "NOTE", "isnull": True, "unique": True}),
+                         ("text2bincat", {"column": "NOTE_rft2text", "yes": ["smoker"], "no": ["non smoker"], "new_col": "SMOKING"})])
+
+    data = pipeline.run(data)
+    """
+
+    def __init__(self, steps: list):
+
+        self.steps = []
+        for func, kwargs in steps:
+            if isinstance(func, str):
+                func = globals()[func]
+            self.steps.append((func, dict(kwargs)))
+
+    def validate(self, columns) -> list:
+
+        """
+        Checks that every column read by a step is in columns or is created by an earlier step.
+        After a step whose new columns depend on the data (cat2var without categories, extract_numbers_from_text),
+        the missing columns can not be known, run checks the columns of each step before calling it.
+
+        :param columns: columns of the input dataframe
+        :return: columns available after the last step, None if they depend on the data
+        :raises ValueError: if a step reads a missing column
+        """
+
+        available = set(columns)
+        known = True
+
+        for func, kwargs in self.steps:
+            name = func.__name__
+
+            missing = _step_missing(name, kwargs, available)
+            if missing and known:
+                raise ValueError(f"{name} reads columns that are not available at this step: {missing}")
+
+            writes = _step_writes(name, kwargs)
+            if writes is None:
+                known = False
+            else:
+                available.update(writes)
+
+        return sorted(available, key=str) if known else None
+
+    def run(self, data, copy: bool = True):
+
+        """
+        :param data: dataframe as pandas dataframe
+        :param copy: if False, no copy is made and the steps can change data itself. Use the returned dataframe,
+                     the new columns are not always added to data.
+        :return: data as dataframe
+        """
+
+        import inspect
+
+        self.validate(data.columns)
+
+        if copy:
+            data = data.copy()
+
+        for func, kwargs in self.steps:
+            # The columns that validate could not check, before the step changes data
+            missing = _step_missing(func.__name__, kwargs, data.columns)
+            if missing:
+                raise ValueError(f"{func.__name__} reads columns that are not available at this step: {missing}")
+
+            token = _PIPELINE_FRAME.set(data)
+            try:
+                if "inplace" in inspect.signature(func).parameters:
+                    result = func(data, inplace=True, **kwargs)
+                else:
+                    result = func(data, **kwargs)
+            finally:
+                _PIPELINE_FRAME.reset(token)
+
+            # The functions of this module return the working dataframe, or a new one that replaces it
+            data = result if result is not None else data
+
+        return data
+
+########################################################################################################################
+########################################################################################################################
+# Result cache
+########################################################################################################################
+########################################################################################################################
+
+# Part of every cache key, change it when the output of a cached function or the layout of the cache changes
+_CACHE_VERSION = 2
+
+class ResultCache:
+
+    """
+    On disk cache of rft2text, extract_numbers_from_text and text2multicat results, stored as Parquet files.
+    The results are keyed by a hash of the input values, the function name and its parameters.
+    rft2text and extract_numbers_from_text are cached per value: on the next run only the new or changed values
+    are computed and the others are read from the cache. text2multicat caches the fitted vocabulary
+    of the whole column, the assignment of the words is always computed because it is fast.
+
+    Every function and parameters has a directory of Parquet segments, a call that computes new values writes them
+    as a new segment, so the cached results are not read and written again. A call reads only the segments
+    that contain its values. Segments are evicted least recently used first when the cache is larger than max_bytes,
+    and segments not used for max_age seconds are deleted. The segments read or written by a call are not evicted
+    by it. It uses the pyarrow library.
+
+    :param directory: cache directory, it is created if it does not exist
+    :param max_bytes: maximum size of the cache in bytes, None is unlimited
+    :param max_age: maximum age in seconds since the last use of a file, None is unlimited
+
+    Test and Example:
+
+    cache = ResultCache("cache/", max_bytes=10 * 2 ** 30, max_age=30 * 24 * 3600)
+
+    data = cache.rft2text(data, "NOTE", isnull=True)
+
+    data = cache.extract_numbers_from_text(data, "NOTE_rft2text")
+
+    cache.hits, cache.misses
+    """
+
+    def __init__(self, directory: str, max_bytes: int = None, max_age: float = None):
+
+        import os
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _namespace(name: str, **params) -> str:
+
+        import hashlib
+        import json
+
+        key = json.dumps([_CACHE_VERSION, name, params], sort_keys=True, default=str)
+
+        return name + "-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+    @staticmethod
+    def _keys(values) -> np.ndarray:
+
+        # 64 bit hash of every value, equal values have equal hashes whatever their row is
+        return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+    def _segments(self, namespace: str) -> list:
+
+        import os
+
+        directory = os.path.join(self.directory, namespace)
+        if not os.path.isdir(directory):
+            return []
+
+        return sorted(os.path.join(directory, i) for i in os.listdir(directory) if i.endswith(".parquet"))
+
+    def _load(self, namespace: str, keys: np.ndarray = None) -> tuple:
+
+        """
+        Reads the segments of namespace that contain any of keys, or all segments if keys is None.
+        A hash found in an earlier segment is skipped in the later ones.
+
+        :return: (table or None, paths of the segments read)
+        """
+
+        import os
+
+        import pyarrow.parquet as pq
+        # pip install pyarrow
+
+        tables = []
+        used = []
+        seen = np.array([], dtype=np.uint64)
+
+        for path in self._segments(namespace):
+            try:
+                if keys is not None:
+                    # Only the hash column is read to find the segments of the values
+                    hashes = pq.read_table(path, columns=["hash"])["hash"].to_numpy()
+                    if not np.isin(hashes, keys).any():
+                        continue
+                table = pd.read_parquet(path)
+            except FileNotFoundError:
+                # Evicted by another process since it was listed
+                continue
+
+            # The modification time is the last use for the LRU eviction
+            os.utime(path)
+            used.append(path)
+
+            if "hash" in table:
+                table = table[~table["hash"].isin(seen)]
+                seen = np.union1d(seen, table["hash"].to_numpy())
+            tables.append(table)
+
+        if not tables:
+            return None, used
+
+        return pd.concat(tables, ignore_index=True), used
+
+    def _save(self, namespace: str, table: pd.DataFrame, used: list = ()):
+
+        """
+        Writes table as a new segment of namespace, the segments already in the cache are not rewritten.
+        The new segment and the segments in used are not evicted by this call.
+        """
+
+        import os
+        import uuid
+
+        directory = os.path.join(self.directory, namespace)
+        os.makedirs(directory, exist_ok=True)
+
+        # Segment names sort in the order they are written
+        path = os.path.join(directory, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+        table.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+        self.evict(keep=list(used) + [path])
+
+    def evict(self, keep: list = ()):
+
+        """
+        Deletes the segments older than max_age, then the least recently used segments until the cache fits max_bytes.
+
+        :param keep: paths of segments that are not deleted, the cache can be larger than max_bytes by their size
+        """
+
+        import os
+
+        keep = {os.path.abspath(i) for i in keep}
+
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".parquet"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+
+        for mtime, size, path in files:
+            old = self.max_age is not None and now - mtime > self.max_age
+            large = self.max_bytes is not None and total > self.max_bytes
+            if not (old or large) or os.path.abspath(path) in keep:
+                continue
+            os.remove(path)
+            total -= size
+
+        self._remove_empty()
+
+    def _remove_empty(self):
+
+        import os
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+
+    def clear(self):
+
+        import os
+
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".parquet"):
+                    os.remove(os.path.join(root, name))
+
+        self._remove_empty()
+
+    def _lookup(self, table, keys: np.ndarray) -> np.ndarray:
+
+        """
+        Positions of keys in table, -1 for the keys not in the cache. Counts hits and misses per row.
+        """
+
+        if table is None:
+            positions = np.full(len(keys), -1)
+        else:
+            positions = pd.Index(table["hash"].to_numpy()).get_indexer(keys)
+
+        missing = int((positions == -1).sum())
+        self.hits += len(keys) - missing
+        self.misses += missing
+
+        return positions
+
+    def rft2text(self, data, column, inplace: bool = False, isnull: bool = False, suffix: str = None, prefix: str = None,
+                 error: str = "strict", n_jobs: int = 1, chunksize: int = 100, progress: bool = False, pool=None):
+
+        """
+        Same as rft2text, the text of each distinct rich text value is computed once and kept in the cache.
+        With pool, the values that fail are not cached and are computed again on the next call.
+        """
+
+        from striprtf.striprtf import rtf_to_text
+
+        if not inplace:
+            data = data.copy()
+
+        if isnull:
+            data[column] = data[column].fillna("")
+
+        values = data[column]
+        keys = self._keys(values)
+
+        namespace = self._namespace("rft2text", error=error)
+        table, used = self._load(namespace, keys)
+        positions = self._lookup(table, keys)
+
+        missing = positions == -1
+        if missing.any():
+            errors = {}
+            converted = _map_values(values[missing], partial(rtf_to_text, errors=error), unique=True, n_jobs=n_jobs,
+                                    chunksize=chunksize, progress=progress, pool=pool, errors=errors)
+
+            # Failed values are not cached
+            converted_ok = np.ones(len(converted), dtype=bool)
+            if errors:
+                failed = np.fromiter(errors, dtype=np.int64, count=len(errors))
+                converted_ok[failed] = False
+                rows = np.flatnonzero(missing)[failed]
+                pool.add_quarantine("rft2text", data.index[rows], values.iloc[rows], list(errors.values()))
+
+            new = pd.DataFrame({"hash": keys[missing][converted_ok],
+                                "text": converted.to_numpy(dtype=object)[converted_ok]}).drop_duplicates("hash")
+            self._save(namespace, new, used)
+            table = new if table is None else pd.concat([table, new], ignore_index=True)
+            positions = pd.Index(table["hash"].to_numpy()).get_indexer(keys)
+
+        text = np.full(len(keys), np.nan, dtype=object)
+        text[positions >= 0] = table["text"].to_numpy(dtype=object)[positions[positions >= 0]]
+        data[_new_col_name(data[column].name, suffix, prefix, "_rft2text")] = text
+
+        return data
+
+    def extract_numbers_from_text(self, data, column: str, col_range: int = 3, inplace: bool = False, long: bool = False,
+                                  tokenizer: str = "regex", tokens: TokenStore = None):
+
+        """
+        Same as extract_numbers_from_text, the numbers of each distinct text are computed once and kept in the cache.
+        """
+
+        values = data[column]
+        keys = self._keys(values)
+
+        if tokens is not None:
+            tokens.check(values)
+            tokenizer = tokens.tokenizer
+
+        namespace = self._namespace("extract_numbers_from_text", col_range=col_range, tokenizer=tokenizer)
+        table, used = self._load(namespace, keys)
+
+        # A text without numbers is kept with an empty label and order -1, so it is not computed again
+        known = None if table is None else table.drop_duplicates("hash")
+        positions = self._lookup(known, keys)
+
+        missing = np.flatnonzero(positions == -1)
+        if len(missing):
+            unique = pd.Series(keys[missing]).drop_duplicates().index.to_numpy()
+            rows = missing[unique]
+            triples = _number_triples(values.iloc[rows], col_range=col_range, tokenizer=tokenizer,
+                                      tokens=None if tokens is None else tokens.take(rows))
+
+            found = pd.DataFrame({"hash": keys[rows][triples["row"].to_numpy()],
+                                  "order": np.arange(len(triples)),
+                                  "label": triples["label"].to_numpy(dtype=object),
+                                  "value": triples["value"].to_numpy()})
+            empty = np.setdiff1d(keys[rows], found["hash"].to_numpy())
+            empty = pd.DataFrame({"hash": empty, "order": -1, "label": None, "value": np.nan})
+
+            new = pd.concat([i for i in (found, empty) if len(i)], ignore_index=True)
+            self._save(namespace, new, used)
+            table = new if table is None else pd.concat([table, new], ignore_index=True)
+
+        # Triples of every row from the cache, in the row order and the order they were found in the text
+        numbers = table[table["order"] >= 0]
+        triples = pd.DataFrame({"row": np.arange(len(keys)), "hash": keys}).merge(numbers, on="hash")
+        triples = triples.sort_values(["row", "order"], kind="stable")
+
+        return _number_columns(data, triples[["row", "label", "value"]].reset_index(drop=True), long=long, inplace=inplace)
+
+    def text2multicat(self, data, column, keyword, extra_stopwords: list = None, inplace: bool = False, threshold: int = 1,
+                      stopwords_lang: str = "turkish", compact: bool = False, tokens: TokenStore = None):
+
+        """
+        Same as text2multicat, the words fitted on a column are kept in the cache and reused while the column
+        does not change.
+        """
+
+        model = Text2MultiCat(keyword, extra_stopwords=extra_stopwords, threshold=threshold, stopwords_lang=stopwords_lang)
+
+        import hashlib
+
+        corpus = hashlib.sha256(self._keys(data[column]).tobytes()).hexdigest()
+        namespace = self._namespace("text2multicat", corpus=corpus, keyword=keyword, extra_stopwords=extra_stopwords,
+                                    stopwords_lang=stopwords_lang, tokenizer=None if tokens is None else tokens.tokenizer)
+        table, used = self._load(namespace)
+
+        if table is None:
+            self.misses += 1
+            model.fit(data, column, tokens=tokens)
+            self._save(namespace, pd.DataFrame({"word": pd.Series(model.words_, dtype=object)}), used)
+        else:
+            self.hits += 1
+            model.words_ = table["word"].tolist()
+            model.vocabulary_ = model.words_[:threshold] if threshold >= 1 else []
+
+        print(model.words_)
+
+        return model.transform(data, column, inplace=inplace, compact=compact)
+
+########################################################################################################################
+########################################################################################################################
+# Out of core
+########################################################################################################################
+########################################################################################################################
+
+def _dataset_files(path: str) -> list:
+
+    """
+    Returns the Parquet files of a partitioned dataset directory (searched recursively) in sorted order,
+    or path itself if it is a file.
+    """
+
+    import os
+
+    if os.path.isfile(path):
+        return [path]
+
+    files = []
+    for root, _, names in os.walk(path):
+        files += [os.path.join(root, i) for i in names if i.endswith(".parquet")]
+
+    return sorted(files)
+
+def _read_partitions(files: list, columns: list = None, batch_size: int = None):
+
+    """
+    Yields (file, batch number, dataframe) for every file, or for every batch_size rows of every file,
+    so only one partition is in memory at a time.
+    """
+
+    import pyarrow.parquet as pq
+    # pip install pyarrow
+
+    for path in files:
+        parquet = pq.ParquetFile(path)
+        if batch_size is None:
+            yield path, 0, parquet.read(columns=columns).to_pandas()
+        else:
+            for k, batch in enumerate(parquet.iter_batches(batch_size=batch_size, columns=columns)):
+                yield path, k, batch.to_pandas()
+
+def _promote_type(a, b, name: str):
+
+    """
+    Returns the Arrow type that holds the values of column name from two partitions with types a and b.
+    """
+
+    import pyarrow as pa
+
+    if a.equals(b):
+        return a
+    elif pa.types.is_null(a):
+        return b
+    elif pa.types.is_null(b):
+        return a
+    elif pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    elif (pa.types.is_integer(a) or pa.types.is_floating(a)) and (pa.types.is_integer(b) or pa.types.is_floating(b)):
+        return pa.float64()
+    elif pa.types.is_dictionary(a) and pa.types.is_dictionary(b) and a.value_type.equals(b.value_type):
+        return pa.dictionary(pa.int32(), a.value_type)
+
+    raise ValueError(f"column {name} is {a} in one partition and {b} in another")
+
+def dataset_categories(path: str, column: str, batch_size: int = 1000000) -> list:
+
+    """
+    Collects the distinct values of a column of a Parquet file or partitioned dataset, reading only that column.
+    The values are in the order they are first found, as column.unique() of the whole data.
+
+    :param path: path of a Parquet file or a directory of Parquet files
+    :param column: column name as string
+    :param batch_size: number of rows read at a time
+    :return: distinct values as list
+
+    Test and Example:
+
+    categories = dataset_categories("history/", "TEST")
+
+    cat2var(data, "TEST", "RESULT", categories=categories)
+    """
+
+    categories = np.array([], dtype=object)
+    for _, _, part in _read_partitions(_dataset_files(path), columns=[column], batch_size=batch_size):
+        categories = pd.unique(np.concatenate([categories, part[column].unique().astype(object)]))
+
+    return list(categories)
+
+def transform_dataset(input_path: str, output_path: str, steps: list, batch_size: int = None, columns: list = None,
+                      progress: bool = False) -> int:
+
+    """
+    Out of core version of Pipeline for datasets larger than memory.
+    It reads a Parquet file or a partitioned Parquet dataset one partition at a time, runs the steps on it
+    and writes it to the output directory, so the memory is bounded by the partition size.
+    The output has the directory layout of the input (a file per input file, or per batch with batch_size),
+    and every output file has the same schema. A file whose types differ from the others
+    (e.g. integers in one partition and floats in another after to_numeric) is rewritten at the end.
+
+    The row wise functions (del_repeated_last_occur_str, rft2text, text2bincat, text2bincat_batch) work as on
+    the whole data, del_repeated_last_occur_str is run with strict=False because a partition can be without
+    the character. cat2var without categories gets the categories of the whole dataset in a pass before,
+    so every partition has the same columns. extract_numbers_from_text must be used with long=True, its output gets
+    a row column with the position of the row in the input dataset. text2multicat can not be used,
+    because its words are fitted on the whole column: fit Text2MultiCat on a sample and use its transform as a step.
+
+    Note: it uses the pyarrow library.
+
+    :param input_path: path of a Parquet file or a directory of Parquet files
+    :param output_path: output directory, it is created if it does not exist and it must not contain Parquet files
+    :param steps: same as Pipeline
+    :param batch_size: number of rows of a partition, None uses the input files as partitions
+    :param columns: columns to read, None reads all columns
+    :param progress: if True, prints the number of rows written after each partition
+    :return: number of rows written
+
+    Test and Example:
+
+    transform_dataset("history/", "history_clean/",
+                      [("del_repeated_last_occur_str", {"char": ".", "column": "RESULT", "to_numeric": True}),
+                       ("cat2var", {"cat_column": "TEST", "var_column": "RESULT"}),
+                       ("rft2text", {"column": "NOTE", "isnull": True, "unique": True})],
+                      batch_size=1000000)
+
+    pd.read_parquet("history_clean/")
+    """
+
+    import os
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # pip install pyarrow
+
+    files = _dataset_files(input_path)
+    if not files:
+        raise ValueError(f"there is no Parquet file in {input_path}")
+    if os.path.isdir(output_path) and _dataset_files(output_path):
+        raise ValueError(f"{output_path} already contains Parquet files")
+
+    names = list(columns) if columns is not None else pq.read_schema(files[0]).names
+
+    resolved = []
+    for func, kwargs in Pipeline(steps).steps:
+        name = func.__name__
+        if name == "del_repeated_last_occur_str":
+            kwargs.setdefault("strict", False)
+        elif name == "cat2var" and kwargs.get("categories") is None:
+            if kwargs["cat_column"] not in names:
+                raise ValueError(f"cat2var categories are collected from the input, {kwargs['cat_column']} is not in it")
+            kwargs["categories"] = dataset_categories(input_path, kwargs["cat_column"])
+        elif name == "extract_numbers_from_text" and not kwargs.get("long"):
+            raise ValueError("extract_numbers_from_text creates columns from the text of each partition, use long=True")
+        elif name == "text2multicat":
+            raise ValueError("text2multicat fits its words on the whole column, use Text2MultiCat.transform as a step")
+        resolved.append((func, kwargs))
+
+    pipeline = Pipeline(resolved)
+    pipeline.validate(names)
+
+    # The long output of extract_numbers_from_text always gets the row column, also for a partition
+    # where every row has one number and the index is the same as the input
+    long_output = any(func.__name__ == "extract_numbers_from_text" for func, _ in resolved)
+
+    written = []
+    schema = None
+    offset = 0
+    rows = 0
+
+    for path, k, part in _read_partitions(files, columns=columns, batch_size=batch_size):
+        # Rows are numbered over the whole dataset, the long output of a step refers to them
+        part.index = pd.RangeIndex(offset, offset + len(part))
+        offset += len(part)
+
+        result = pipeline.run(part, copy=False)
+        if long_output:
+            result = result.rename_axis("row").reset_index()
+
+        table = pa.Table.from_pandas(result, preserve_index=False)
+
+        # Arrow can not type an object column without values, the new object columns of the functions are text
+        table = table.cast(pa.schema([i.with_type(pa.string()) if pa.types.is_null(i.type) else i for i in table.schema],
+                                     metadata=table.schema.metadata))
+
+        if schema is None:
+            schema = table.schema
+        elif table.schema.names != schema.names:
+            raise ValueError(f"partition {path} gives columns {table.schema.names}, the first partition {schema.names}")
+        else:
+            schema = pa.schema([i.with_type(_promote_type(i.type, j.type, i.name)) for i, j in zip(schema, table.schema)],
+                               metadata=schema.metadata)
+
+        relative = os.path.relpath(path, input_path) if os.path.isdir(input_path) else os.path.basename(path)
+        if batch_size is not None:
+            relative = f"{relative[:-len('.parquet')]}-{k:05d}.parquet"
+        target = os.path.join(output_path, relative)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        pq.write_table(table, target)
+        written.append((target, table.schema))
+
+        rows += len(result)
+
+        if progress:
+            print(f"{rows} rows written to {output_path}")
+
+    # The partitions written before the types were widened are rewritten with the final schema
+    for target, table_schema in written:
+        if not table_schema.equals(schema):
+            pq.write_table(pq.read_table(target).cast(schema), target)
+
+    return rows
+
+########################################################################################################################
+########################################################################################################################
+# Asynchronous programming
+########################################################################################################################
+########################################################################################################################
+
+def _read_table(path: str, **kwargs) -> pd.DataFrame:
+
+    """
+    Reads a CSV, Parquet or Excel file, selected from the file extension.
+    """
+
+    lower = str(path).lower()
+    if lower.endswith(".parquet"):
+        return pd.read_parquet(path, **kwargs)
+    elif lower.endswith((".xlsx", ".xls")):
+        return pd.read_excel(path, **kwargs)
+
+    return pd.read_csv(path, **kwargs)
+
+def _parquet_sink(directory: str, path: str, data: pd.DataFrame):
+
+    """
+    Writes the result of a file to directory as Parquet, with the name of the file.
+    """
+
+    import os
+
+    name = os.path.splitext(os.path.basename(path))[0] + ".parquet"
+    data.to_parquet(os.path.join(directory, name), index=False)
+
+async def ingest_async(files: list, steps: list, sink, reader=None, read_workers: int = 4, n_jobs: int = -1,
+                       queue_size: int = 2, executor=None, **kwargs) -> pd.DataFrame:
+
+    """
+    Reads files, cleans them with Pipeline steps and sends the results to a sink, with the reading, the cleaning
+    and the writing of different files at the same time. Files are read in a thread pool, the steps run in
+    a process pool and the sink is called as each file finishes, so the total time is close to the longer of
+    the reading and the cleaning instead of their sum.
+    The stages are joined by queues of queue_size files. When the cleaning is slower, the reading waits,
+    so at most about 2 * queue_size + read_workers + n_jobs files are in memory.
+
+    A file that can not be read, cleaned or written does not stop the others, it is reported with its error.
+    The dataframes are copied to the worker processes, so the steps should be slower than pickling the data.
+
+    Use it with await in a running event loop (e.g. Jupyter), or use ingest.
+
+    :param files: file paths, CSV, Parquet or Excel by extension
+    :param steps: same as Pipeline
+    :param sink: function called as sink(path, data) with the cleaned dataframe of every file, in the order
+                 the files finish. It runs in the thread pool of the reading, never two calls at a time.
+                 A directory path writes every result there as a Parquet file with the name of the input file.
+    :param reader: function called as reader(path, **kwargs) to read a file, None reads by the file extension
+    :param read_workers: number of files read at a time
+    :param n_jobs: number of worker processes, -1 uses all cores, 1 runs the steps in a thread of this process.
+                   With executor, it is the number of workers of the executor, so many files are transformed at a time.
+    :param queue_size: number of files waiting between two stages
+    :param executor: a concurrent.futures executor for the steps to reuse, it is not shut down
+    :param kwargs: other parameters of reader, such as encoding or sep of pd.read_csv
+    :return: report as dataframe with file, rows, read_seconds, transform_seconds and error columns
+
+    Test and Example:
+
+    files = [os.path.join("data/", i) for i in be.read_all_csv_files("data/")]
+
+    report = await ingest_async(files, [("rft2text", {"column": "NOTE", "isnull": True})], "clean/", encoding="latin-1")
+    """
+
+    import asyncio
+    import os
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from time import perf_counter
+
+    pipeline = Pipeline(steps)
+    reader = reader or _read_table
+
+    if isinstance(sink, str):
+        os.makedirs(sink, exist_ok=True)
+        sink = partial(_parquet_sink, sink)
+
+    workers = _n_workers(n_jobs)
+
+    own_executor = executor is None
+    if own_executor:
+        if n_jobs == 1:
+            executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+    io_executor = ThreadPoolExecutor(max_workers=read_workers + 1)
+    loop = asyncio.get_running_loop()
+
+    report = {path: {"file": path, "rows": None, "read_seconds": None, "transform_seconds": None, "error": None}
+              for path in files}
+
+    paths = asyncio.Queue()
+    for path in report:
+        paths.put_nowait(path)
+    frames = asyncio.Queue(maxsize=queue_size)
+    results = asyncio.Queue(maxsize=queue_size)
+
+    async def read():
+
+        while not paths.empty():
+            path = paths.get_nowait()
+            start = perf_counter()
+            try:
+                data = await loop.run_in_executor(io_executor, partial(reader, path, **kwargs))
+            except Exception as error:
+                report[path]["error"] = f"read {type(error).__name__}: {error}"
+                continue
+            report[path]["read_seconds"] = perf_counter() - start
+
+            # Waits while the cleaning is behind
+            await frames.put((path, data))
+
+    async def transform():
+
+        while (item := await frames.get()) is not None:
+            path, data = item
+            start = perf_counter()
+            try:
+                data = await loop.run_in_executor(executor, pipeline.run, data, False)
+            except Exception as error:
+                report[path]["error"] = f"transform {type(error).__name__}: {error}"
+                continue
+            report[path]["transform_seconds"] = perf_counter() - start
+
+            await results.put((path, data))
+
+    async def write():
+
+        while (item := await results.get()) is not None:
+            path, data = item
+            try:
+                await loop.run_in_executor(io_executor, sink, path, data)
+            except Exception as error:
+                report[path]["error"] = f"sink {type(error).__name__}: {error}"
+                continue
+            report[path]["rows"] = len(data)
+
+    readers = [asyncio.create_task(read()) for _ in range(read_workers)]
+    transformers = [asyncio.create_task(transform()) for _ in range(workers)]
+    writer = asyncio.create_task(write())
+
+    try:
+        await asyncio.gather(*readers)
+        for _ in transformers:
+            await frames.put(None)
+        await asyncio.gather(*transformers)
+        await results.put(None)
+        await writer
+    finally:
+        for task in readers + transformers + [writer]:
+            task.cancel()
+        io_executor.shutdown(cancel_futures=True)
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+    return pd.DataFrame(list(report.values()), columns=["file", "rows", "read_seconds", "transform_seconds", "error"])
+
+def ingest(files: list, steps: list, sink, reader=None, read_workers: int = 4, n_jobs: int = -1, queue_size: int = 2,
+           executor=None, **kwargs) -> pd.DataFrame:
+
+    """
+    Runs ingest_async in a new event loop, see ingest_async for the parameters.
+
+    Test and Example:
+
+    files = [os.path.join("data/", i) for i in be.read_all_csv_files("data/")]
+
+    report = ingest(files, [("del_repeated_last_occur_str", {"char": ".", "column": "RESULT", "strict": False}),
+                            ("cat2var", {"cat_column": "TEST", "var_column": "RESULT", "categories": tests})],
+                    "clean/", n_jobs=8)
+
+    report[report["error"].notnull()]
+    """
+
+    import asyncio
+
+    return asyncio.run(ingest_async(files, steps, sink, reader=reader, read_workers=read_workers, n_jobs=n_jobs,
+                                    queue_size=queue_size, executor=executor, **kwargs))
+
+
+########################################################################################################################
+########################################################################################################################
+# Parallel Programming
+########################################################################################################################
+########################################################################################################################
+
+def partitions(data, partition_size: int = 100000):
+
+    """
+    Splits a dataframe into row partitions, in order.
+
+    :param data: dataframe as pandas dataframe
+    :param partition_size: number of rows of a partition
+    :return: generator of dataframes
+    """
+
+    for i in range(0, len(data), partition_size):
+        yield data.iloc[i:i + partition_size]
+
+def _n_workers(n_jobs: int) -> int:
+
+    """
+    Number of workers of n_jobs, -1 is the number of cores.
+    """
+
+    import os
+
+    return (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+
+def _apply_partition(func, partition, args: tuple, kwargs: dict):
+
+    return func(partition, *args, **kwargs)
+
+def parallel_apply(data, func, *args, partition_size: int = 100000, n_jobs: int = -1, executor=None, **kwargs):
+
+    """
+    Runs a row independent function of this module on row partitions of a dataframe in a process pool,
+    and concatenates the results in the original row order.
+    rft2text, text2bincat, text2bincat_batch, del_repeated_last_occur_str and extract_numbers_from_text can be used.
+    cat2var can be used only with the categories parameter, otherwise each partition creates its own columns.
+
+    The function runs on copies of the partitions with inplace=True: they are copied to the worker processes
+    of a process pool, and copied before they are submitted to other executors such as a thread pool.
+    At most two partitions per worker are waiting in the pool at a time.
+
+    Note: columns created from the values (extract_numbers_from_text) are the union of the columns of all partitions,
+    in the order they are found.
+
+    :param data: dataframe as pandas dataframe
+    :param func: function or name of a function of this module, the first parameter must be the dataframe.
+                 It must be picklable, lambdas and local functions can not be used.
+    :param args: other positional parameters of func
+    :param partition_size: number of rows of a partition
+    :param n_jobs: number of worker processes, -1 uses all cores, 1 runs in the current process.
+                   With executor, it is the number of workers of the executor, it bounds the waiting partitions.
+    :param executor: a concurrent.futures executor to reuse, it is not shut down. None creates a process pool.
+    :param kwargs: other keyword parameters of func
+    :return: data as dataframe
+
+    Test and Example:
+
+    data = parallel_apply(data, "rft2text", "NOTE", isnull=True, unique=True, partition_size=50000, n_jobs=8)
+
+    data = parallel_apply(data, text2bincat, "NOTE", ["smoker"], ["non smoker"], new_col="SMOKING")
+    """
+
+    import inspect
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    if isinstance(func, str):
+        func = globals()[func]
+
+    if "inplace" in inspect.signature(func).parameters:
+        kwargs.setdefault("inplace", True)
+
+    if n_jobs == 1 and executor is None:
+        # The partitions are slices of data, they are copied one by one so data is not changed
+        results = [func(partition.copy(), *args, **kwargs) for partition in partitions(data, partition_size)]
+        return pd.concat(results) if results else func(data.copy(), *args, **kwargs)
+
+    workers = _n_workers(n_jobs)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    results = []
+    pending = deque()
+    try:
+        for partition in partitions(data, partition_size):
+            # A process pool pickles the partition, the other executors would run func on a slice of data
+            if not isinstance(executor, ProcessPoolExecutor):
+                partition = partition.copy()
+            pending.append(executor.submit(_apply_partition, func, partition, args, kwargs))
+            # Bound the number of partitions waiting in the pool
+            if len(pending) >= 2 * workers:
+                results.append(pending.popleft().result())
+        while pending:
+            results.append(pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+    # An empty dataframe has no partition, it gets the columns of func on a copy so data is not changed
+    return pd.concat(results) if results else func(data.copy(), *args, **kwargs)
+
+########################################################################################################################
+########################################################################################################################
+# Subprocess
+########################################################################################################################
+########################################################################################################################
+
+def _address_space() -> int:
+
+    """
+    Virtual memory of this process in bytes on Linux, 0 elsewhere.
+    """
+
+    import os
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _worker_main(conn, memory_mb: int = None):
+
+    """
+    Loop of a WorkerPool subprocess. It receives (func, items) batches and sends ("ok", result) or ("error", message)
+    for every item, until it receives None or the pipe is closed.
+    """
+
+    if memory_mb:
+        import resource
+
+        limit = _address_space() + memory_mb * 2 ** 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+
+        func, items = message
+        for item in items:
+            try:
+                result = ("ok", func(item))
+            except MemoryError:
+                result = ("error", "MemoryError: memory limit of the worker is exceeded")
+            except Exception as error:
+                result = ("error", f"{type(error).__name__}: {error}")
+
+            try:
+                conn.send(result)
+            except Exception as error:
+                conn.send(("error", f"{type(error).__name__}: {error}"))
+
+class WorkerPool:
+
+    """
+    Pool of subprocesses for conversions that can fail, hang or use too much memory, such as rft2text on malformed
+    rich text. Every value is converted in a worker process, with a time limit per value and a memory limit
+    per worker. A value that raises, times out or crashes its worker fails alone: it gets NaN, its error is put
+    in quarantine, and a killed worker is replaced. The workers are started once and reused by every call
+    until close, so the startup cost is paid once.
+
+    :param n_workers: number of worker processes, None uses the number of cores
+    :param timeout: seconds a value can take, None has no limit. The worker of a value that takes longer is killed.
+    :param memory_mb: memory in MB a worker can allocate on top of its own memory after startup, None has no limit.
+                      It limits the address space with the resource module, it is not available on Windows.
+    :param chunksize: number of values sent to a worker at a time, the time limit is still per value
+    :param context: multiprocessing start method, "spawn" starts clean workers without the memory of this process
+
+    Test and Example:
+
+    with WorkerPool(n_workers=4, timeout=10, memory_mb=1024) as pool:
+        data = rft2text(data, "NOTE", isnull=True, unique=True, pool=pool)
+        other = rft2text(other, "NOTE", isnull=True, pool=pool)
+
+        pool.quarantine
+    """
+
+    def __init__(self, n_workers: int = None, timeout: float = None, memory_mb: int = None, chunksize: int = 10,
+                 context: str = "spawn"):
+
+        import os
+
+        if memory_mb:
+            try:
+                import resource
+            except ImportError:
+                raise ValueError("memory_mb needs the resource module, it is not available on this platform")
+
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.chunksize = chunksize
+        self.context = context
+        self.workers = []
+        self.quarantine = pd.DataFrame(columns=["function", "row", "value", "error"])
+
+    def _start_worker(self) -> dict:
+
+        import multiprocessing
+
+        context = multiprocessing.get_context(self.context)
+        parent, child = context.Pipe()
+        process = context.Process(target=_worker_main, args=(child, self.memory_mb), daemon=True)
+        process.start()
+        child.close()
+
+        return {"process": process, "conn": parent, "batch": [], "deadline": None}
+
+    def start(self) -> "WorkerPool":
+
+        """
+        Starts the workers that are not running, map starts them too.
+        """
+
+        self.workers = [i for i in self.workers if i["process"].is_alive()]
+        while len(self.workers) < self.n_workers:
+            self.workers.append(self._start_worker())
+
+        return self
+
+    def _replace(self, worker: dict) -> dict:
+
+        worker["process"].kill()
+        worker["process"].join()
+        worker["conn"].close()
+
+        new = self._start_worker()
+        self.workers[self.workers.index(worker)] = new
+
+        return new
+
+    def map(self, func, items, progress: bool = False) -> tuple:
+
+        """
+        Applies func to every item in the workers.
+
+        :param func: function of one value, it must be picklable (module level function or partial)
+        :param items: values as list, numpy array or series
+        :param progress: if True, shows a progress bar. It uses the tqdm library.
+        :return: results as numpy object array, NaN for the failed items,
+                 and errors as dict of the position of every failed item and its error message
+        """
+
+        import time as clock
+        from collections import deque
+        from multiprocessing.connection import wait
+
+        items = list(items)
+        results = np.full(len(items), np.nan, dtype=object)
+        errors = {}
+
+        bar = None
+        if progress:
+            from tqdm import tqdm
+            # pip install tqdm
+
+            bar = tqdm(total=len(items))
+
+        def done(worker, status, value):
+            position = worker["batch"].pop(0)
+            if status == "ok":
+                results[position] = value
+            else:
+                errors[position] = value
+            worker["deadline"] = None if self.timeout is None else clock.monotonic() + self.timeout
+            if bar is not None:
+                bar.update(1)
+
+        def fail(worker, message):
+            # The current item failed, the rest of the batch goes back to the queue for the new worker
+            rest = worker["batch"][1:]
+            worker["batch"] = worker["batch"][:1]
+            done(worker, "error", message)
+            pending.extendleft(reversed(rest))
+            return self._replace(worker)
+
+        self.start()
+        pending = deque(range(len(items)))
+
+        try:
+            while pending or any(i["batch"] for i in self.workers):
+                for worker in self.workers:
+                    if not worker["batch"] and pending:
+                        worker["batch"] = [pending.popleft() for _ in range(min(self.chunksize, len(pending)))]
+                        worker["conn"].send((func, [items[i] for i in worker["batch"]]))
+                        worker["deadline"] = None if self.timeout is None else clock.monotonic() + self.timeout
+
+                busy = [i for i in self.workers if i["batch"]]
+                deadlines = [i["deadline"] for i in busy if i["deadline"] is not None]
+                wait_time = max(min(deadlines) - clock.monotonic(), 0) if deadlines else None
+
+                ready = wait([i["conn"] for i in busy], timeout=wait_time)
+
+                for worker in busy:
+                    if worker["conn"] in ready:
+                        try:
+                            done(worker, *worker["conn"].recv())
+                        except (EOFError, OSError):
+                            worker["process"].join()
+                            fail(worker, f"WorkerError: the worker stopped with exit code {worker['process'].exitcode}")
+                    elif worker["deadline"] is not None and clock.monotonic() >= worker["deadline"]:
+                        fail(worker, f"TimeoutError: no result in {self.timeout} seconds")
+        except BaseException:
+            # The workers may still be sending results of this call, they are not reused
+            self.close()
+            raise
+        finally:
+            if bar is not None:
+                bar.close()
+
+        return results, errors
+
+    def add_quarantine(self, function: str, rows, values, errors: list):
+
+        """
+        Appends failed rows to quarantine.
+
+        :param function: name of the function
+        :param rows: index labels of the rows
+        :param values: values of the rows
+        :param errors: error messages of the rows
+        """
+
+        new = pd.DataFrame({"function": function, "row": list(rows), "value": list(values), "error": list(errors)},
+                           columns=self.quarantine.columns)
+        self.quarantine = new if self.quarantine.empty else pd.concat([self.quarantine, new], ignore_index=True)
+
+    def close(self):
+
+        """
+        Stops the workers, the pool starts new workers if it is used again.
+        """
+
+        for worker in self.workers:
+            try:
+                worker["conn"].send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker["process"].join(timeout=1)
+            if worker["process"].is_alive():
+                worker["process"].kill()
+                worker["process"].join()
+            worker["conn"].close()
+        self.workers = []
+
+    def __enter__(self) -> "WorkerPool":
+
+        return self.start()
+
+    def __exit__(self, *args):
+
+        self.close()
+
+
+########################################################################################################################
+########################################################################################################################
+# Decorators
+########################################################################################################################
+########################################################################################################################
+
+# Sink of the measurements of instrumented functions, None turns the instrumentation off
+_SINK = None
+_TRACE_MEMORY = False
+
+class MemorySink:
+
+    """
+    Keeps the measurements of instrumented functions in a list.
+    """
+
+    def __init__(self):
+
+        self.records = []
+
+    def __call__(self, record: dict):
+
+        self.records.append(record)
+
+    def to_frame(self) -> pd.DataFrame:
+
+        return pd.DataFrame(self.records)
+
+    def clear(self):
+
+        self.records.clear()
+
+class LoggerSink:
+
+    """
+    Writes the measurements of instrumented functions to a logger.
+
+    :param logger: logging.Logger, None uses the logger of this module
+    :param level: logging level
+    """
+
+    def __init__(self, logger=None, level: int = 20):
+
+        import logging
+
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def __call__(self, record: dict):
+
+        self.logger.log(self.level, "%(function)s %(seconds).4f s rows %(rows_in)s -> %(rows_out)s "
+                                    "memory %(memory_mb)s MB copied %(copied)s error %(error)s", record)
+
+class JsonLinesSink:
+
+    """
+    Appends the measurements of instrumented functions to a JSON lines file, one line per call.
+
+    :param path: path of the file
+    """
+
+    def __init__(self, path: str):
+
+        self.path = path
+
+    def __call__(self, record: dict):
+
+        import json
+
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+def enable_instrumentation(sink=None, memory: bool = False):
+
+    """
+    Turns the instrumentation on.
+
+    :param sink: callable receiving a dict per call, such as MemorySink, LoggerSink or JsonLinesSink.
+                 None creates a MemorySink.
+    :param memory: if True, the peak memory of each call is measured with tracemalloc. It slows the functions down.
+    :return: sink
+
+    Test and Example:
+
+    sink = enable_instrumentation()
+
+    instrument_module(be)
+
+    data = cat2var(data, "TEST", "RESULT")
+
+    sink.to_frame()
+
+    disable_instrumentation()
+    """
+
+    global _SINK, _TRACE_MEMORY
+
+    _SINK = sink if sink is not None else MemorySink()
+    _TRACE_MEMORY = memory
+
+    return _SINK
+
+def disable_instrumentation():
+
+    global _SINK, _TRACE_MEMORY
+
+    _SINK = None
+    _TRACE_MEMORY = False
+
+def _rows(value):
+
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+def instrument(func):
+
+    """
+    Decorator recording the wall time, the rows of the input and output dataframes,
+    the peak memory delta (with memory=True) and whether the input dataframe was copied, for every call of func.
+    The record is sent to the sink of enable_instrumentation.
+    When the instrumentation is off, the function is called directly.
+    """
+
+    from functools import wraps
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+
+        sink = _SINK
+        if sink is None:
+            return func(*args, **kwargs)
+
+        import tracemalloc
+
+        data = args[0] if args else kwargs.get("data")
+
+        trace = _TRACE_MEMORY
+        if trace:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        error = None
+        result = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+
+            memory = None
+            if trace:
+                memory = (tracemalloc.get_traced_memory()[1] - before) / 2 ** 20
+                if started:
+                    tracemalloc.stop()
+
+            copied = None
+            if isinstance(data, pd.DataFrame) and isinstance(result, pd.DataFrame):
+                copied = result is not data
+
+            sink({"function": f"{func.__module__}.{func.__qualname__}", "time": time.time(), "seconds": seconds,
+                  "rows_in": _rows(data), "rows_out": _rows(result), "memory_mb": memory, "copied": copied,
+                  "error": error})
+
+    wrapper._instrumented = True
+
+    return wrapper
+
+def instrument_module(module):
+
+    """
+    Applies instrument to every public function defined in a module, such as data or be.
+    Functions that are already instrumented, async functions and the functions of this section are skipped.
+
+    :param module: module
+    :return: names of the instrumented functions
+    """
 
+    import inspect
 
+    names = []
+    for name, obj in list(vars(module).items()):
+        if name.startswith("_") or name in _NOT_INSTRUMENTED or not inspect.isfunction(obj):
+            continue
+        # The wrapper would only measure the creation of the coroutine
+        if inspect.iscoroutinefunction(obj):
+            continue
+        if obj.__module__ != module.__name__ or getattr(obj, "_instrumented", False):
+            continue
+        setattr(module, name, instrument(obj))
+        names.append(name)
 
+    return names
 
+_NOT_INSTRUMENTED = {"enable_instrumentation", "disable_instrumentation", "instrument", "instrument_module", "partitions"}
 
+instrument_module(sys.modules[__name__])